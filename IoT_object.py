@@ -1,3 +1,4 @@
+import atexit
 import random
 import time
 import requests
@@ -6,6 +7,12 @@ import socket
 import threading
 from datetime import datetime
 
+import edge_filter
+import frame_codec
+import framing
+import metrics
+import spool
+
 # Configuration
 object_info = {
     "id": "kgsghhoaNhzlkln",
@@ -22,6 +29,19 @@ TOTAL_SETS = 3
 REP_DURATION = 3.0  # seconds
 
 SERVER_ADDRESS = ('192.168.11.104', 12345)  # Address and port for the socket server
+SERVER_URL = "http://localhost:5000"  # Flask server receiving the workout data
+
+# Batching of workout frames sent to /handle_use_batch
+BATCH_MAX_FRAMES = 20  # flush once this many frames are buffered (one rep)
+BATCH_MAX_DELAY = 0.5  # seconds a frame may wait in the buffer before a flush
+FRAME_FORMAT = 'json'  # 'json' or 'binary' (packed frames, see frame_codec.py)
+CLIENT_IDLE_TIMEOUT = 300  # seconds a persistent command connection may stay silent
+SPOOL_PATH = 'device_spool.bin'  # on-disk ring buffer of frames not yet delivered
+
+# On-device filtering of the sensor stream (see edge_filter.py)
+SMOOTHING = 'one_euro'  # 'ema', 'one_euro' or None
+DEADBAND = 0.03  # metres a sensor must move before a new frame is sent
+KEYFRAME_INTERVAL = 1.0  # seconds between frames sent even when nothing moves
 
 # Starting positions (in meters)
 LEFT_SHOULDER_POS = (-0.2, 1.4, 0)   # x, y, z
@@ -74,10 +94,11 @@ def calculate_positions(progress, going_up):
         'right_elbow': {k: round(v, 3) for k, v in right_elbow.items()}
     }
 
-def generate_workout_data(current_set, total_reps, positions):
+def generate_workout_data(current_set, total_reps, positions, object_id=None):
     """Generate a single data point during the exercise"""
     return {
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'object_id': object_id or object_info['id'],
+        'timestamp': datetime.now().isoformat(sep=' ', timespec='milliseconds'),
         'exercise': EXERCISE,
         'weight': WEIGHT,
         'current_set': current_set,
@@ -93,18 +114,169 @@ def generate_workout_data(current_set, total_reps, positions):
         'battery': random.randint(60, 100)
     }
 
+# Shared keep-alive session so consecutive posts reuse the same connection
+session = requests.Session()
+
+# Device-side send metrics, returned by the "metrics" command
+device_metrics = metrics.Registry()
+SEND_LATENCY = device_metrics.histogram(
+    'dumbbell_device_send_duration_seconds', "Time to post frames to the server", ('endpoint',))
+SEND_FAILURES = device_metrics.counter(
+    'dumbbell_device_send_failures_total', "Posts that failed or were rejected",
+    ('endpoint', 'reason'))
+FRAMES_SENT = device_metrics.counter(
+    'dumbbell_device_frames_sent_total', "Frames accepted by the server")
+FRAMES_SUPPRESSED = device_metrics.counter(
+    'dumbbell_device_frames_suppressed_total', "Frames dropped by the deadband before sending")
+
+def record_send(url, started, ok, reason, frames=1):
+    """Record one post to the server; `reason` says why it failed"""
+    endpoint = url.rsplit('/', 1)[-1]
+    SEND_LATENCY.observe(time.perf_counter() - started, endpoint)
+    if ok:
+        FRAMES_SENT.inc(amount=frames)
+    else:
+        SEND_FAILURES.inc(endpoint, reason)
+
 def send_to_server(url, data):
     
     """Send data to the local server"""
+    started = time.perf_counter()
     try:
-        response = requests.post(url, json=data)
-        return response.status_code == 200
+        response = session.post(url, json=data)
     except Exception as e:
+        record_send(url, started, False, type(e).__name__)
         print(f"Error sending data: {e}")
         return False
+    ok = response.status_code == 200
+    record_send(url, started, ok, f"http_{response.status_code}")
+    return ok
+
+class BatchSender:
+    """
+    Buffer workout frames and post them to /handle_use_batch in one request
+    frames are flushed when max_frames are buffered or when the oldest one
+    has waited max_delay seconds, over a single pooled keep-alive connection
+    binary: send packed frames instead of a JSON array
+    """
+
+    def __init__(self, url, max_frames=BATCH_MAX_FRAMES, max_delay=BATCH_MAX_DELAY,
+                 binary=False):
+        self.url = url
+        self.max_frames = max_frames
+        self.max_delay = max_delay
+        self.binary = binary
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()  # protects the buffer
+        self._send_lock = threading.Lock()  # keeps batches in order on the wire
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._run, daemon=True)
+        self._timer.start()
+
+    def send(self, data):
+        """Queue a frame, flushing immediately if the batch is full"""
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(data)
+            full = len(self._buffer) >= self.max_frames
+        if full:
+            return self.flush()
+        return True
+
+    def flush(self):
+        """Post every buffered frame in a single request"""
+        with self._send_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                self._oldest = None
+            if not batch:
+                return True
+            started = time.perf_counter()
+            try:
+                if self.binary:
+                    response = self.session.post(self.url, data=frame_codec.encode_frames(batch),
+                                                 headers=frame_codec.frame_headers(batch[0]))
+                else:
+                    response = self.session.post(self.url, json=batch)
+            except Exception as e:
+                record_send(self.url, started, False, type(e).__name__)
+                print(f"Error sending batch of {len(batch)} frames: {e}")
+                return False
+            ok = response.status_code == 200
+            record_send(self.url, started, ok, f"http_{response.status_code}", len(batch))
+            return ok
+
+    def _run(self):
+        """Flush frames that have been waiting longer than max_delay"""
+        while not self._stop.wait(self.max_delay / 2):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+            if due:
+                self.flush()
+
+    def close(self):
+        """Stop the flush timer and send whatever is left"""
+        self._stop.set()
+        self._timer.join()
+        self.flush()
+        self.session.close()
+
+# Workout frames go through a durable on-disk spool drained by one sender
+# thread for the lifetime of the device, so the sampling loop never waits on
+# the server and frames survive outages and restarts
+_spool_sender = None
+_spool_lock = threading.Lock()
+
+def get_spool_sender():
+    """Start the spool sender on first use (it resumes any backlog left on disk)"""
+    global _spool_sender
+    with _spool_lock:
+        if _spool_sender is None:
+            _spool_sender = spool.SpoolSender(
+                f"{SERVER_URL}/handle_use_batch", spool.RingSpool(SPOOL_PATH),
+                max_delay=BATCH_MAX_DELAY, binary=FRAME_FORMAT == 'binary', on_send=record_send)
+            atexit.register(_spool_sender.close)
+        return _spool_sender
+
+device_metrics.gauge(
+    'dumbbell_device_spool_frames', "Frames waiting in the on-disk spool",
+    function=lambda: _spool_sender.backlog() if _spool_sender else 0)
+device_metrics.counter(
+    'dumbbell_device_spool_dropped_total', "Frames overwritten while the spool was full",
+    function=lambda: _spool_sender.spool.dropped if _spool_sender else 0)
+device_metrics.counter(
+    'dumbbell_device_spool_quarantined_total', "Frames dropped because the server kept refusing them",
+    function=lambda: _spool_sender.quarantined if _spool_sender else 0)
+
+def pace(next_tick, interval):
+    """Sleep until the next sample time; returns the one after it"""
+    next_tick += interval
+    delay = next_tick - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+        return next_tick
+    return time.monotonic()  # running late: restart the schedule instead of bursting
+
+def make_frame_filter():
+    """Smoothing and deadband stage between calculate_positions() and the sender"""
+    return edge_filter.FrameFilter(SMOOTHING, DEADBAND, KEYFRAME_INTERVAL)
+
+def filter_frame(frame_filter, data, now=None):
+    """Frame to send, or None when the deadband suppresses it"""
+    data = frame_filter.process(data, now)
+    if data is None:
+        FRAMES_SUPPRESSED.inc()
+    return data
+
 #To send client info    
 def send_info(info_object):
-    send_to_server("http://localhost:5000/handle_info",info_object)
+    send_to_server(f"{SERVER_URL}/handle_info", info_object)
 
 def use_object():
     """Run the main simulation loop"""
@@ -115,6 +287,10 @@ def use_object():
     
     current_set = 1
     total_reps = 0
+    sender = get_spool_sender()
+    frame_filter = make_frame_filter()
+    interval = REP_DURATION / 20
+    next_tick = time.monotonic()
     
     try:
         while current_set <= TOTAL_SETS:
@@ -125,8 +301,10 @@ def use_object():
                 data = generate_workout_data(current_set, total_reps, positions)
                 print(f"\rSet {current_set}, Rep {(total_reps % REPS_PER_SET) + 1}, "
                       f"Height: {positions['left_dumbbell']['y']:.2f}m", end='')
-                send_to_server("http://localhost:5000/handle_use",data)
-                time.sleep(REP_DURATION / 20)
+                data = filter_frame(frame_filter, data)
+                if data is not None:
+                    sender.send(data)
+                next_tick = pace(next_tick, interval)
             
             # Down movement
             for i in range(10):
@@ -135,8 +313,10 @@ def use_object():
                 data = generate_workout_data(current_set, total_reps, positions)
                 print(f"\rSet {current_set}, Rep {(total_reps % REPS_PER_SET) + 1}, "
                       f"Height: {positions['left_dumbbell']['y']:.2f}m", end='')
-                send_to_server("http://localhost:5000/handle_use",data)
-                time.sleep(REP_DURATION / 20)
+                data = filter_frame(frame_filter, data)
+                if data is not None:
+                    sender.send(data)
+                next_tick = pace(next_tick, interval)
             
             total_reps += 1
             print()  # New line after each rep
@@ -147,36 +327,67 @@ def use_object():
                 if current_set <= TOTAL_SETS:
                     print(f"\nRest between sets (30 seconds)...")
                     time.sleep(30)
+                    next_tick = time.monotonic()
         
         print("\nWorkout complete!")
     except KeyboardInterrupt:
         print("\nSimulation stopped by user")        
+    finally:
+        sender.flush()  # the rest is delivered in the background
     
 
+def handle_command(message):
+    """Execute a single command and return the reply"""
+    if message == "use":
+        print("Received 'use' command. Starting workout...")
+        # Lancer une action côté serveur si nécessaire
+        threading.Thread(target=use_object).start() 
+        # Répondre au client avec "ok"
+        return "ok"
+
+    elif message.startswith("act"):
+        print(f"Received 'act' command with message: {message[4:]}")
+        # Répondre au client si nécessaire
+        return "action acknowledged"
+
+    elif message == "ping":
+        # Health check from the server's connection pool
+        return "pong"
+
+    elif message == "metrics":
+        # Send latency and failure counters, in Prometheus text format
+        return device_metrics.render()
+
+    else:
+        print(f"Unknown command received: {message}")
+        # Répondre avec un message d'erreur au client
+        return "unknown command"
+
 def handle_client(client_socket):
-    """Handle a client connection"""
+    """
+    Handle a client connection
+    Length-prefixed clients may send any number of (pipelined) commands on the
+    same connection; legacy clients send one bare command and get one reply
+    """
     with client_socket as sock:
         try:
-            # Recevoir le message du client
-            message = sock.recv(1024).decode('utf-8').strip()
-
-            if message == "use":
-                print("Received 'use' command. Starting workout...")
-                # Répondre au client avec "ok"
-                sock.sendall(b"ok")
-                # Lancer une action côté serveur si nécessaire
-                threading.Thread(target=use_object).start() 
-
-            elif message.startswith("act"):
-                print(f"Received 'act' command with message: {message[4:]}")
-                # Répondre au client si nécessaire
-                sock.sendall(b"action acknowledged")
-            
-            else:
-                print(f"Unknown command received: {message}")
-                # Répondre avec un message d'erreur au client
-                sock.sendall(b"unknown command")
+            sock.settimeout(CLIENT_IDLE_TIMEOUT)
+            prefix = sock.recv(framing.HEADER.size, socket.MSG_PEEK)
+
+            if framing.is_legacy_command(prefix):
+                # Recevoir le message du client
+                message = sock.recv(1024).decode('utf-8').strip()
+                sock.sendall(handle_command(message).encode('utf-8'))
+                return
+
+            while True:
+                message = framing.recv_message(sock)
+                if message is None:
+                    break
+                framing.send_message(sock, handle_command(message.strip()))
         
+        except socket.timeout:
+            pass
         except Exception as e:
             print(f"Error while handling client: {e}")
 
@@ -192,8 +403,32 @@ def start_server():
             threading.Thread(target=handle_client, args=(client_socket,)).start()
 
 if __name__ == "__main__":
-    send_info(object_info)
+    import argparse
+    parser = argparse.ArgumentParser(description="Smart dumbbell simulator")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="serve commands from an asyncio event loop instead of threads")
+    parser.add_argument('--smoothing', choices=sorted(edge_filter.FILTERS) + ['none'], default=SMOOTHING,
+                        help="filter applied to the sensor coordinates before sending")
+    parser.add_argument('--deadband', type=float, default=DEADBAND,
+                        help="metres a sensor must move before a new frame is sent (0 sends every frame)")
+    parser.add_argument('--keyframe-interval', type=float, default=KEYFRAME_INTERVAL,
+                        help="seconds between frames sent even when nothing moves")
+    args = parser.parse_args()
+    SMOOTHING = None if args.smoothing == 'none' else args.smoothing
+    DEADBAND = args.deadband
+    KEYFRAME_INTERVAL = args.keyframe_interval
+
     try:
-        start_server()
+        if args.use_async:
+            import asyncio
+            import async_device
+            import IoT_object  # the module async_device reads its settings from, not __main__
+            IoT_object.SMOOTHING, IoT_object.DEADBAND = SMOOTHING, DEADBAND
+            IoT_object.KEYFRAME_INTERVAL = KEYFRAME_INTERVAL
+            asyncio.run(async_device.main(object_info, SERVER_ADDRESS))
+        else:
+            send_info(object_info)
+            get_spool_sender()  # deliver frames left over from a previous run
+            start_server()
     except KeyboardInterrupt:
         print("\nSimulation stopped by user")
@@ -0,0 +1,287 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+from samples import parse_timestamp
+
+
+# Analyse en continu des trames : détection des répétitions par pics et creux
+# de la hauteur des haltères, amplitude, tempo et asymétrie gauche/droite.
+# Chaque objet garde une fenêtre glissante dans un tampon circulaire NumPy ;
+# le travail par trame est O(1) amorti (chaque trame est relue au plus une
+# fois, lors de la clôture de la répétition qui la contient).
+
+WINDOW = 512            # trames conservées par objet
+MIN_AMPLITUDE = 0.05    # m : hystérésis entre un pic et un creux
+SET_IDLE_TIMEOUT = 60   # s sans trame (horloge du serveur) avant de clôturer la série en cours
+
+# Colonnes du tampon circulaire
+TS, LEFT_Y, RIGHT_Y, LEFT_ELBOW_Y, RIGHT_ELBOW_Y = range(5)
+
+CREATE_SET_METRICS = '''
+    CREATE TABLE IF NOT EXISTS set_metrics (
+        id INTEGER PRIMARY KEY,
+        object_id TEXT NOT NULL,
+        session_start REAL NOT NULL,
+        set_number INTEGER,
+        started_at REAL,
+        ended_at REAL,
+        exercise TEXT,
+        weight REAL,
+        reps INTEGER,         -- répétitions détectées par le serveur
+        device_reps INTEGER,  -- répétitions annoncées par l'objet
+        avg_rom REAL,
+        avg_concentric REAL,
+        avg_eccentric REAL,
+        avg_rep_duration REAL,
+        avg_asymmetry REAL
+    )
+'''
+
+SET_COLUMNS = ('object_id', 'session_start', 'set_number', 'started_at', 'ended_at',
+               'exercise', 'weight', 'reps', 'device_reps', 'avg_rom', 'avg_concentric',
+               'avg_eccentric', 'avg_rep_duration', 'avg_asymmetry')
+
+INSERT_SET_METRICS = (
+    f"INSERT INTO set_metrics ({', '.join(SET_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in SET_COLUMNS)})"
+)
+
+
+def create_schema(connection):
+    """Crée la table des métriques par série"""
+    connection.execute(CREATE_SET_METRICS)
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS idx_set_metrics_object ON set_metrics (object_id, started_at)'
+    )
+
+
+def set_row(summary):
+    """Tuple d'insertion d'un résumé de série, dans l'ordre de SET_COLUMNS"""
+    return tuple(summary[column] for column in SET_COLUMNS)
+
+
+class RingBuffer:
+    """Tampon circulaire de lignes float64 de largeur fixe"""
+
+    def __init__(self, capacity, width):
+        self.data = np.empty((capacity, width))
+        self.capacity = capacity
+        self.total = 0  # nombre de lignes écrites depuis le début
+
+    def append(self, row):
+        self.data[self.total % self.capacity] = row
+        self.total += 1
+        return self.total - 1
+
+    def since(self, position):
+        """Lignes écrites depuis la position absolue `position` (tronquées à la fenêtre)"""
+        start = max(position, self.total - self.capacity)
+        first, last = start % self.capacity, self.total % self.capacity
+        if start >= self.total:
+            return self.data[:0]
+        if first < last:
+            return self.data[first:last]
+        return np.concatenate((self.data[first:], self.data[:last]))
+
+
+class DeviceAnalyzer:
+    """État d'analyse d'un objet : répétitions et série en cours"""
+
+    def __init__(self, object_id, window=WINDOW):
+        self.object_id = object_id
+        self.buffer = RingBuffer(window, 5)
+        self.lock = threading.Lock()
+        self.session_start = None
+        self.evicted = False  # retiré du moteur : une trame doit en créer un nouveau
+        # Réception de la dernière trame (horloge monotone du serveur) : l'horloge
+        # de l'objet peut être décalée ou rejouée, elle ne mesure pas l'inactivité
+        self.received_at = None
+        self._reset_set(None)
+
+    def _reset_set(self, set_number):
+        self.set_number = set_number
+        self.set_started = None
+        self.last_seen = None
+        self.exercise = None
+        self.weight = None
+        self.device_reps = 0
+        self.reps = []
+        # Détecteur : on cherche d'abord un creux (haltères en bas)
+        self.going_up = False
+        self.extreme = None          # (position, ts, y) du candidat pic/creux
+        self.trough = None           # dernier creux confirmé
+        self.peak = None             # pic confirmé depuis ce creux
+
+    def process(self, frame):
+        """Intègre une trame ; renvoie la liste des événements produits"""
+        sensors = frame.get('sensors') or {}
+        try:
+            left_y = sensors['left_dumbbell']['y']
+            right_y = sensors['right_dumbbell']['y']
+            left_elbow_y = sensors['left_elbow']['y']
+            right_elbow_y = sensors['right_elbow']['y']
+            heights = (left_y, right_y, left_elbow_y, right_elbow_y)
+            # Coordonnée absente (null) ou non numérique : trame inexploitable
+            if not all(isinstance(y, (int, float)) and not isinstance(y, bool) and math.isfinite(y)
+                       for y in heights):
+                return []
+        except (KeyError, TypeError):
+            return []
+        ts = parse_timestamp(frame.get('timestamp'))
+        set_number = frame.get('current_set')
+
+        events = []
+        if self.set_number is not None and set_number != self.set_number:
+            events.extend(self.finish_set())
+            # Un numéro de série qui recule marque une nouvelle séance
+            if set_number is not None and set_number < (self.set_number or 0):
+                self.session_start = None
+            self._reset_set(set_number)
+        if self.session_start is None:
+            self.session_start = ts
+        if self.set_started is None:
+            self.set_number = set_number
+            self.set_started = ts
+        self.last_seen = ts
+        self.exercise = frame.get('exercise', self.exercise)
+        self.weight = frame.get('weight', self.weight)
+        self.device_reps = max(self.device_reps, frame.get('current_rep') or 0)
+
+        position = self.buffer.append((ts, left_y, right_y, left_elbow_y, right_elbow_y))
+        y = (left_y + right_y) / 2
+
+        if self.extreme is None:
+            self.extreme = (position, ts, y)
+        elif self.going_up:
+            if y > self.extreme[2]:
+                self.extreme = (position, ts, y)
+            elif y < self.extreme[2] - MIN_AMPLITUDE:
+                # Pic confirmé : fin de la phase concentrique
+                self.peak = self.extreme
+                self.going_up = False
+                self.extreme = (position, ts, y)
+        else:
+            if y < self.extreme[2]:
+                self.extreme = (position, ts, y)
+            elif y > self.extreme[2] + MIN_AMPLITUDE:
+                # Creux confirmé : clôture la répétition précédente s'il y a eu un pic
+                trough = self.extreme
+                if self.trough is not None and self.peak is not None:
+                    events.append(('rep', self._finish_rep(self.trough, self.peak, trough)))
+                self.trough = trough
+                self.peak = None
+                self.going_up = True
+                self.extreme = (position, ts, y)
+        return events
+
+    def _finish_rep(self, start, peak, end):
+        # Fenêtre de la répétition, du creux de départ au creux d'arrivée
+        window = self.buffer.since(start[0])[:end[0] - start[0] + 1]
+        left_rom = float(np.ptp(window[:, LEFT_Y]))
+        right_rom = float(np.ptp(window[:, RIGHT_Y]))
+        elbow_rom = float(np.ptp((window[:, LEFT_ELBOW_Y] + window[:, RIGHT_ELBOW_Y]) / 2))
+        largest = max(left_rom, right_rom)
+        rep = {
+            'object_id': self.object_id,
+            'set_number': self.set_number,
+            'rep': len(self.reps) + 1,
+            'started_at': start[1],
+            'ended_at': end[1],
+            'rom': round((left_rom + right_rom) / 2, 3),
+            'elbow_rom': round(elbow_rom, 3),
+            'concentric': round(peak[1] - start[1], 3),
+            'eccentric': round(end[1] - peak[1], 3),
+            'duration': round(end[1] - start[1], 3),
+            'asymmetry': round(abs(left_rom - right_rom) / largest, 3) if largest else 0.0,
+        }
+        self.reps.append(rep)
+        return rep
+
+    def finish_set(self):
+        """Clôture la série en cours ; renvoie les événements ('rep' en suspens puis 'set')"""
+        if self.set_started is None:
+            return []
+        events = []
+        # La dernière descente n'est confirmée par aucune remontée : la clore ici
+        if (self.trough is not None and self.peak is not None and not self.going_up
+                and self.extreme[2] < self.peak[2] - MIN_AMPLITUDE):
+            events.append(('rep', self._finish_rep(self.trough, self.peak, self.extreme)))
+            self.trough, self.peak = self.extreme, None
+
+        reps = self.reps
+        count = len(reps)
+
+        def average(key):
+            return round(sum(rep[key] for rep in reps) / count, 3) if count else None
+
+        summary = {
+            'object_id': self.object_id,
+            'session_start': self.session_start,
+            'set_number': self.set_number,
+            'started_at': self.set_started,
+            'ended_at': self.last_seen,
+            'exercise': self.exercise,
+            'weight': self.weight,
+            'reps': count,
+            'device_reps': self.device_reps,
+            'avg_rom': average('rom'),
+            'avg_concentric': average('concentric'),
+            'avg_eccentric': average('eccentric'),
+            'avg_rep_duration': average('duration'),
+            'avg_asymmetry': average('asymmetry'),
+        }
+        self.set_started = None
+        events.append(('set', summary))
+        return events
+
+
+class AnalyticsEngine:
+    """
+    Analyseurs indexés par object_id ; celui d'un objet silencieux est retiré
+    une fois sa série clôturée (la trame suivante en recrée un)
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.analyzers = {}
+        self._lock = threading.Lock()
+
+    def _analyzer(self, object_id):
+        analyzer = self.analyzers.get(object_id)
+        if analyzer is None:
+            with self._lock:
+                analyzer = self.analyzers.setdefault(object_id, DeviceAnalyzer(object_id, self.window))
+        return analyzer
+
+    def process(self, object_id, frame, now=None):
+        """Liste d'événements ('rep', dict) ou ('set', dict) produits par la trame"""
+        now = time.monotonic() if now is None else now
+        while True:
+            analyzer = self._analyzer(object_id)
+            with analyzer.lock:
+                if not analyzer.evicted:
+                    analyzer.received_at = now
+                    return analyzer.process(frame)
+
+    def sweep(self, now=None, idle=SET_IDLE_TIMEOUT):
+        """
+        Clôture les séries des objets dont aucune trame n'est reçue depuis `idle`
+        secondes et retire leurs analyseurs ; `now` sur l'horloge monotone
+        """
+        now = time.monotonic() if now is None else now
+        events = []
+        for analyzer in list(self.analyzers.values()):
+            with analyzer.lock:
+                if analyzer.received_at is not None and now - analyzer.received_at < idle:
+                    continue
+                # Sans last_seen, l'analyseur n'a reçu aucune trame exploitable : rien à clôturer
+                if analyzer.last_seen is not None:
+                    events.extend(analyzer.finish_set())
+                analyzer.evicted = True
+                with self._lock:
+                    if self.analyzers.get(analyzer.object_id) is analyzer:
+                        del self.analyzers[analyzer.object_id]
+        return events
@@ -0,0 +1,326 @@
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+import frame_codec
+import framing
+from IoT_object import (
+    EXERCISE, REPS_PER_SET, TOTAL_SETS, REP_DURATION, SERVER_URL,
+    BATCH_MAX_FRAMES, BATCH_MAX_DELAY, FRAME_FORMAT,
+    calculate_positions, generate_workout_data, make_frame_filter, filter_frame,
+)
+
+# asyncio device mode: one event loop serves the framed command protocol and
+# runs workouts as coroutines, so a gateway can host many devices (and many
+# sockets) without a thread per connection or per workout.
+
+MAX_SESSIONS = 16          # concurrent command connections per device
+HTTP_TIMEOUT = 5.0         # seconds for connect / response on the telemetry link
+REST_BETWEEN_SETS = 30     # seconds
+CLIENT_IDLE_TIMEOUT = 300  # seconds a command connection may stay silent
+
+
+class AsyncHTTPClient:
+    """Minimal HTTP/1.1 client keeping one keep-alive connection open"""
+
+    def __init__(self, base_url, timeout=HTTP_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                keep_alive = False
+        if length:
+            await self._reader.readexactly(length)
+        if not keep_alive:
+            await self.close()
+        return status
+
+    async def post(self, path, body, headers):
+        """POST `body` and return the status code, reconnecting once on a stale connection"""
+        head = [f"POST {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        request = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+        async with self._lock:
+            for attempt in range(2):
+                reused = self._writer is not None
+                try:
+                    if not reused:
+                        await self._connect()
+                    self._writer.write(request)
+                    await self._writer.drain()
+                    return await asyncio.wait_for(self._read_response(), self.timeout)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError,
+                        asyncio.TimeoutError, ValueError, IndexError):
+                    await self.close()
+                    if not reused or attempt:
+                        raise
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class SendStats:
+    """Counters of a sender, shareable between many senders (see fleet.py)"""
+
+    def __init__(self):
+        self.frames_generated = 0   # produced by the workout loop
+        self.frames_suppressed = 0  # dropped by the on-device filter
+        self.frames_sent = 0
+        self.frames_failed = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_error = None
+
+
+class AsyncBatchSender:
+    """
+    Non-blocking counterpart of IoT_object.BatchSender
+    send() only appends to the buffer; a background task flushes it on size
+    or age thresholds, so the workout loop never waits on the server
+    """
+
+    def __init__(self, client, path='/handle_use_batch', max_frames=BATCH_MAX_FRAMES,
+                 max_delay=BATCH_MAX_DELAY, binary=False, stats=None, verbose=True):
+        self.client = client
+        self.path = path
+        self.max_frames = max_frames
+        self.max_delay = max_delay
+        self.binary = binary
+        self.stats = stats or SendStats()
+        self.verbose = verbose
+        self._buffer = []
+        self._full = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, data):
+        self._buffer.append(data)
+        if len(self._buffer) >= self.max_frames:
+            self._full.set()
+
+    async def flush(self):
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return True
+        if self.binary:
+            body = frame_codec.encode_frames(batch)
+            headers = frame_codec.frame_headers(batch[0])
+        else:
+            body = json.dumps(batch).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+        stats = self.stats
+        stats.requests += 1
+        try:
+            status = await self.client.post(self.path, body, headers)
+        except Exception as e:
+            stats.last_error = repr(e)
+            if self.verbose:
+                print(f"Error sending batch of {len(batch)} frames: {e}")
+            status = None
+        if status == 200:
+            stats.frames_sent += len(batch)
+            return True
+        if status is not None:
+            stats.last_error = f"HTTP {status}"
+        stats.errors += 1
+        stats.frames_failed += len(batch)
+        return False
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def close(self):
+        self._closed = True
+        self._full.set()
+        await self._task
+        await self.flush()
+
+
+class AsyncDevice:
+    """A simulated dumbbell served from an asyncio event loop"""
+
+    def __init__(self, info, server_url=SERVER_URL, max_sessions=MAX_SESSIONS,
+                 frame_format=FRAME_FORMAT, verbose=True):
+        self.info = info
+        self.server_url = server_url
+        self.max_sessions = max_sessions
+        self.frame_format = frame_format
+        self.verbose = verbose
+        self.sessions = 0
+        self.workout_task = None
+        self.server = None
+
+    async def start(self, host, port):
+        """Start listening for framed commands"""
+        self.server = await asyncio.start_server(self._handle_client, host, port)
+        return self.server
+
+    async def serve_forever(self, host, port):
+        server = await self.start(host, port)
+        print(f"Async server listening on {(host, port)}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_client(self, reader, writer):
+        if self.sessions >= self.max_sessions:
+            await framing.write_message(writer, "busy")
+            writer.close()
+            return
+        self.sessions += 1
+        try:
+            # Three bytes are enough to tell a bare legacy command from a length prefix
+            prefix = await asyncio.wait_for(reader.readexactly(3), CLIENT_IDLE_TIMEOUT)
+            if framing.is_legacy_command(prefix):
+                try:
+                    rest = await asyncio.wait_for(reader.read(1024), 0.05)
+                except asyncio.TimeoutError:
+                    rest = b''
+                message = (prefix + rest).decode('utf-8').strip()
+                writer.write(self.handle_command(message).encode('utf-8'))
+                await writer.drain()
+                return
+
+            message = await self._read_first_frame(reader, prefix)
+            while message is not None:
+                await framing.write_message(writer, self.handle_command(message.strip()))
+                message = await asyncio.wait_for(framing.read_message(reader), CLIENT_IDLE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, framing.FramingError,
+                ConnectionError):
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    @staticmethod
+    async def _read_first_frame(reader, prefix):
+        """Finish reading a frame whose first header bytes were already consumed"""
+        header = prefix + await reader.readexactly(framing.HEADER.size - len(prefix))
+        (length,) = framing.HEADER.unpack(header)
+        if length > framing.MAX_MESSAGE:
+            raise framing.FramingError(f"Frame of {length} bytes exceeds the {framing.MAX_MESSAGE} byte limit")
+        return (await reader.readexactly(length)).decode('utf-8')
+
+    def handle_command(self, message):
+        if message == "use":
+            if self.workout_task and not self.workout_task.done():
+                return "busy"
+            self.workout_task = asyncio.create_task(self.run_workout())
+            return "ok"
+        elif message == "act stop":
+            # Forget the task right away: a second stop sent while it unwinds gets "idle"
+            task, self.workout_task = self.workout_task, None
+            if task and not task.done():
+                task.cancel()
+                return "stopped"
+            return "idle"
+        elif message.startswith("act"):
+            return "action acknowledged"
+        elif message == "ping":
+            return "pong"
+        return "unknown command"
+
+    async def run_workout(self, total_sets=TOTAL_SETS, reps_per_set=REPS_PER_SET,
+                          rep_duration=REP_DURATION, rest=REST_BETWEEN_SETS,
+                          frames_per_rep=20, time_scale=1.0, stats=None, filter_frames=True):
+        """
+        Workout loop as a coroutine; cancel the task to stop it (CancelledError
+        is re-raised once the sender and client are closed)
+        frames_per_rep: samples per repetition (half going up, half going down)
+        time_scale: time compression factor, 10 plays a workout ten times faster
+        stats: SendStats to accumulate into (shared across a fleet)
+        filter_frames: smooth and deadband frames before sending (see edge_filter.py);
+        False sends every sample, so the send rate is exactly the sampling rate
+        """
+        object_id = self.info['id']
+        client = AsyncHTTPClient(self.server_url)
+        sender = AsyncBatchSender(client, binary=self.frame_format == 'binary',
+                                  stats=stats, verbose=self.verbose)
+        stats = sender.stats
+        frame_filter = make_frame_filter() if filter_frames else None
+        clock = asyncio.get_running_loop().time
+        half = max(2, frames_per_rep // 2)
+        interval = rep_duration / (2 * half) / time_scale
+        current_set = 1
+        total_reps = 0
+        try:
+            while current_set <= total_sets:
+                for going_up in (True, False):
+                    for i in range(half):
+                        positions = calculate_positions(i / (half - 1), going_up=going_up)
+                        data = generate_workout_data(current_set, total_reps, positions, object_id)
+                        stats.frames_generated += 1
+                        if frame_filter is not None:
+                            # Filter on workout time, so time_scale does not change what is sent
+                            data = filter_frame(frame_filter, data, clock() * time_scale)
+                        if data is None:
+                            stats.frames_suppressed += 1
+                        else:
+                            sender.send(data)
+                        await asyncio.sleep(interval)
+                total_reps += 1
+                if total_reps % reps_per_set == 0:
+                    current_set += 1
+                    if current_set <= total_sets and rest:
+                        await asyncio.sleep(rest / time_scale)
+            if self.verbose:
+                print(f"\n{object_id}: {EXERCISE} workout complete!")
+        except asyncio.CancelledError:
+            if self.verbose:
+                print(f"\n{object_id}: workout stopped")
+            raise
+        finally:
+            await sender.close()
+            await client.close()
+        return sender
+
+
+async def register(info, server_url=SERVER_URL):
+    """Announce a device to the server through /handle_info"""
+    client = AsyncHTTPClient(server_url)
+    try:
+        body = json.dumps(info).encode('utf-8')
+        return await client.post('/handle_info', body, {'Content-Type': 'application/json'})
+    finally:
+        await client.close()
+
+
+async def main(info, address):
+    await register(info)
+    await AsyncDevice(info).serve_forever(*address)
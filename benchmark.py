@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Endpoint benchmarks for the Flask app in server.py
+#
+# Drives the app in-process through the Flask test client and over a local
+# socket (werkzeug server on an ephemeral port), reports throughput and
+# p50/p95/p99 latency, writes the results to JSON and fails when a run
+# regresses past --threshold against a saved baseline.
+#
+#   python benchmark.py --update-baseline          # record a baseline
+#   python benchmark.py --threshold 0.25           # compare against it
+#
+# The server runs inside a scratch directory so the repository's database
+# and JSON files are never touched.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(REPO_DIR, 'benchmark_baseline.json')
+RESULTS_PATH = os.path.join(REPO_DIR, 'benchmark_results.json')
+THRESHOLD = 0.20  # allowed relative regression of throughput or p95 latency
+
+# Minimal templates used only when the real ones are not deployed, so the
+# view code (queries, registry reads) can still be measured.
+FALLBACK_TEMPLATES = {
+    'home.html': '{{ user["name"] }} {{ user_objects|length }} {{ new_ob|length }} {{ weekly_performance }}',
+    'dashboard.html': '{{ user["name"] }} {{ objects|length }} {{ stats }}',
+}
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (ms) of a list of per-call durations (s)"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(q):
+        return round(ordered[min(count - 1, int(q * count))] * 1000, 3)
+
+    return {
+        'count': count,
+        'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(ordered) / count * 1000, 3),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def measure(call, iterations, warmup=20):
+    """Time `call(i)` sequentially; the call must raise or return False on failure"""
+    for i in range(warmup):
+        call(-1 - i)
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        if call(i) is False:
+            failures += 1
+        latencies.append(time.perf_counter() - begin)
+    result = summarize(latencies, time.perf_counter() - started)
+    result['failures'] = failures
+    return result
+
+
+class Bench:
+    """Holds the imported server module, its clients and the results"""
+
+    def __init__(self, server, iterations):
+        self.server = server
+        self.iterations = iterations
+        self.client = server.app.test_client()
+        self.results = {}
+        self.http = None
+        self.base_url = None
+
+    def record(self, name, result):
+        self.results[name] = result
+        print(f"{name:<36} {result['throughput']:>10.1f}/s  p50={result['p50_ms']:.3f}ms  "
+              f"p95={result['p95_ms']:.3f}ms  p99={result['p99_ms']:.3f}ms", flush=True)
+
+    def start_socket_server(self):
+        import requests
+        from werkzeug.serving import make_server
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.httpd = make_server('127.0.0.1', 0, self.server.app, threaded=True)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.http = requests.Session()
+
+    def stop_socket_server(self):
+        if self.http is not None:
+            self.http.close()
+            self.httpd.shutdown()
+
+
+def sample_frame(object_id, seq=0):
+    import IoT_object
+    positions = IoT_object.calculate_positions((seq % 10) / 9, going_up=(seq // 10) % 2 == 0)
+    frame = IoT_object.generate_workout_data(1, seq // 20, positions, object_id)
+    frame['timestamp'] = time.time()
+    return frame
+
+
+def bench_ingest(bench):
+    """/handle_use and /handle_use_batch, in-process and over a socket"""
+    frames = [sample_frame('bench-ingest', i) for i in range(200)]
+    client = bench.client
+
+    def post_inprocess(i):
+        return client.post('/handle_use', json=frames[i % len(frames)]).status_code == 200
+    bench.record('ingest.handle_use.inprocess', measure(post_inprocess, bench.iterations))
+
+    def post_socket(i):
+        return bench.http.post(f"{bench.base_url}/handle_use",
+                               json=frames[i % len(frames)]).status_code == 200
+    bench.record('ingest.handle_use.socket', measure(post_socket, bench.iterations))
+
+    batch = frames[:20]
+
+    def post_batch(i):
+        return bench.http.post(f"{bench.base_url}/handle_use_batch", json=batch).status_code == 200
+    result = measure(post_batch, max(1, bench.iterations // 10))
+    result['frames_per_s'] = round(result['throughput'] * len(batch), 1)
+    bench.record('ingest.handle_use_batch20.socket', result)
+
+
+def bench_registration(bench, sizes):
+    """/handle_info against registries of growing size"""
+    registry = bench.server.registry
+    for size in sizes:
+        missing = size - len(registry)
+        for index in range(max(0, missing)):
+            registry.register({'id': f'bench-fill-{len(registry)}-{index}', 'name': 'fill', 'weight': 1})
+
+        def register(i, size=size):
+            payload = {'id': f'bench-reg-{size}-{i}', 'name': 'bench', 'weight': 10}
+            return bench.client.post('/handle_info', json=payload).status_code == 200
+        bench.record(f'handle_info.registry_{size}', measure(register, bench.iterations // 2))
+
+
+def bench_home(bench, sizes):
+    """/home (and /dashboard) for users linked to a growing number of objects, rendered and from the page cache"""
+    connection = sqlite3.connect(bench.server.DATABASE)
+    for size in sizes:
+        user_id = f'bench-user-{size}'
+        with connection:
+            connection.execute('INSERT OR IGNORE INTO users (id, name, age, username, password) '
+                               'VALUES (?, ?, ?, ?, ?)', (user_id, 'Bench', 30, user_id, 'x'))
+            for index in range(size):
+                object_id = f'bench-obj-{size}-{index}'
+                connection.execute('INSERT OR IGNORE INTO objects (id, name, state) VALUES (?, ?, ?)',
+                                   (object_id, 'Bench dumbbell', 'off'))
+                connection.execute('INSERT OR IGNORE INTO users_objects (user_id, object_id) '
+                                   'VALUES (?, ?)', (user_id, object_id))
+        client = bench.server.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+
+        page_cache = bench.server.page_cache
+        for route in ('/home', '/dashboard'):
+            # Uncached: the user's pages are invalidated before each call, so the view renders
+            def render(i, route=route):
+                page_cache.invalidate_user(user_id)
+                return client.get(route).status_code == 200
+            bench.record(f'{route.strip("/")}.objects_{size}', measure(render, bench.iterations // 2))
+
+            def get(i, route=route):
+                return client.get(route).status_code == 200
+            bench.record(f'{route.strip("/")}.objects_{size}.cached', measure(get, bench.iterations // 2))
+    connection.close()
+
+
+def bench_sse(bench, fanouts, frames=200):
+    """/workout delivery latency from POST /handle_use to every subscriber"""
+    object_id = 'bench-sse'
+    bench.client.post('/handle_use', json=sample_frame(object_id))  # initial snapshot
+    for count in fanouts:
+        latencies = []
+        lock = threading.Lock()
+        ready = threading.Barrier(count + 1)
+        responses = []
+
+        def subscribe():
+            response = bench.server.app.test_client().get(
+                f'/workout?object_id={object_id}', buffered=False)
+            responses.append(response)
+            ready.wait()
+            for chunk in response.response:
+                received = time.perf_counter()
+                text = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+                lines = text.splitlines()
+                data = [line[6:] for line in lines if line.startswith('data: ')]
+                if not data or 'event: analytics' in lines:
+                    continue
+                # Snapshot first, then patches holding only the changed fields
+                frame = json.loads(data[0])
+                if frame.get('bench_stop') == count:
+                    break
+                if frame.get('bench_sent') is not None:
+                    with lock:
+                        latencies.append(received - frame['bench_sent'])
+
+        threads = [threading.Thread(target=subscribe, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+
+        started = time.perf_counter()
+        for seq in range(frames):
+            frame = sample_frame(object_id, seq)
+            frame['bench_sent'] = time.perf_counter()
+            bench.client.post('/handle_use', json=frame)
+            time.sleep(0.002)
+        stop = sample_frame(object_id)
+        stop['bench_stop'] = count  # the next round's snapshot must not stop its subscribers
+        bench.client.post('/handle_use', json=stop)
+        for thread in threads:
+            thread.join(30)
+        elapsed = time.perf_counter() - started
+        for response in responses:
+            response.close()
+
+        result = summarize(latencies or [0.0], elapsed)
+        result['expected'] = frames * count
+        result['dropped'] = frames * count - len(latencies)
+        bench.record(f'workout_sse.subscribers_{count}', result)
+
+
+def compare(results, baseline, threshold):
+    """List of human-readable regressions beyond `threshold`"""
+    regressions = []
+    for name, previous in baseline.get('results', {}).items():
+        current = results.get(name)
+        if not current:
+            continue
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {current['throughput']}/s "
+                               f"< baseline {previous['throughput']}/s")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {previous['p95_ms']}ms")
+    return regressions
+
+
+def load_server(workdir):
+    """Import server.py with its working files in `workdir`"""
+    for name in ('new_objects.json', 'connected_object.json'):
+        with open(os.path.join(workdir, name), 'w') as file:
+            json.dump([], file)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    # Private live-frame segment, so a running server's shared memory is left alone
+    os.environ['DUMBBELL_SHM_NAME'] = f'dumbbell_bench_{os.getpid()}'
+    import server  # migrates the scratch database on import
+
+    from jinja2 import ChoiceLoader, DictLoader
+    server.app.jinja_loader = ChoiceLoader([server.app.jinja_loader, DictLoader(FALLBACK_TEMPLATES)])
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the smart dumbbell server endpoints")
+    parser.add_argument('--iterations', type=int, default=1000, help="calls per scenario")
+    parser.add_argument('--registry-sizes', default='100,1000,5000')
+    parser.add_argument('--home-sizes', default='1,10,100')
+    parser.add_argument('--sse-subscribers', default='1,10,50')
+    parser.add_argument('--only', help="comma-separated scenarios: ingest,registration,home,sse")
+    parser.add_argument('--output', default=RESULTS_PATH, help="where to write this run's results")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="save this run as the new baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="allowed relative regression (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def sizes(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    only = set(args.only.split(',')) if args.only else {'ingest', 'registration', 'home', 'sse'}
+    workdir = tempfile.mkdtemp(prefix='dumbbell-bench-')
+    cwd = os.getcwd()
+    try:
+        server = load_server(workdir)
+        bench = Bench(server, args.iterations)
+        bench.start_socket_server()
+        try:
+            if 'ingest' in only:
+                bench_ingest(bench)
+            if 'registration' in only:
+                bench_registration(bench, sizes(args.registry_sizes))
+            if 'home' in only:
+                bench_home(bench, sizes(args.home_sizes))
+            if 'sse' in only:
+                bench_sse(bench, sizes(args.sse_subscribers))
+        finally:
+            bench.stop_socket_server()
+            server.sample_writer.stop()
+            server.live_frames.close()
+            server.live_frames.unlink()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': bench.results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    regressions = compare(bench.results, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        return 1
+    print(f"No regression beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
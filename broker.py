@@ -0,0 +1,91 @@
+from collections import deque
+import threading
+
+
+# Diffusion en mémoire des trames par objet : chaque abonné (flux SSE /workout)
+# possède sa propre file bornée ; quand elle est pleine, la plus ancienne trame
+# est abandonnée pour que les clients lents ne retiennent jamais la production.
+
+QUEUE_SIZE = 64  # trames en attente par abonné
+
+ALL_OBJECTS = None  # clé d'abonnement à tous les objets
+
+
+class Subscription:
+    """File bornée d'un abonné, avec politique « abandonner la plus ancienne »"""
+
+    def __init__(self, object_id, maxsize=QUEUE_SIZE):
+        self.object_id = object_id
+        self.queue = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, message):
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(message)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Renvoie le prochain message, ou None après `timeout` secondes sans rien"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue or self.closed, timeout)
+            if self.queue:
+                return self.queue.popleft()
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class Broker:
+    """Registre des abonnés indexé par object_id"""
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, object_id=ALL_OBJECTS):
+        subscription = Subscription(object_id, self.queue_size)
+        with self._lock:
+            # Copie à l'écriture : publish() parcourt la liste sans verrou
+            current = self._subscribers.get(object_id, ())
+            self._subscribers[object_id] = current + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            current = self._subscribers.get(subscription.object_id, ())
+            remaining = tuple(s for s in current if s is not subscription)
+            if remaining:
+                self._subscribers[subscription.object_id] = remaining
+            else:
+                self._subscribers.pop(subscription.object_id, None)
+
+    def publish(self, object_id, message):
+        """Pousse un message aux abonnés de l'objet et aux abonnés de tous les objets"""
+        targets = self._subscribers.get(object_id, ())
+        if object_id is not ALL_OBJECTS:
+            targets = targets + self._subscribers.get(ALL_OBJECTS, ())
+        for subscription in targets:
+            subscription.put(message)
+        return len(targets)
+
+    def subscriber_count(self, object_id=ALL_OBJECTS):
+        """Nombre d'abonnés d'un objet, ou de tous les abonnés sans argument"""
+        if object_id is ALL_OBJECTS:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+        return len(self._subscribers.get(object_id, ()))
+
+    def queue_depths(self):
+        """Messages en attente de chaque abonné, indexés par objet (None : tous les objets)"""
+        return {
+            object_id: [len(subscription.queue) for subscription in subscriptions]
+            for object_id, subscriptions in list(self._subscribers.items())
+        }
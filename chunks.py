@@ -0,0 +1,240 @@
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import samples
+
+
+# Historique compressé des capteurs : au lieu d'une ligne par échantillon, les
+# trames d'un objet sont regroupées par série (current_set) en blocs colonnes.
+# Chaque colonne est quantifiée en entiers (ms, mm, dixièmes de degré), codée
+# en différences successives puis compressée avec zlib. Chaque bloc garde aussi
+# un aperçu (PREVIEW_POINTS points choisis par LTTB) : une requête sur une
+# longue période lit les aperçus et non les blocs complets.
+
+CHUNK_MAX_SAMPLES = 600   # échantillons par bloc (30 s à 20 trames/s)
+CHUNK_MAX_GAP = 60        # s sans trame avant de commencer un nouveau bloc
+CHUNK_IDLE_TIMEOUT = 30   # s sans trame avant d'écrire le bloc ouvert d'un objet
+PREVIEW_POINTS = 64       # points de l'aperçu de chaque bloc
+PREVIEW_RATIO = 4         # aperçus utilisés au-delà de points * PREVIEW_RATIO échantillons
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+DEFAULT_FIELD = 'ld_y'    # hauteur de l'haltère gauche, la courbe affichée
+
+FORMAT_VERSION = 1
+
+# Colonnes stockées et facteur de quantification de chacune
+FIELDS = ('ts',) + samples.COORD_COLUMNS + ('current_rep', 'total_reps', 'temp', 'battery')
+SCALES = {'ts': 1000, 'temp': 10, **{column: 1000 for column in samples.COORD_COLUMNS}}
+_ROW_INDEX = [samples.COLUMNS.index(field) for field in FIELDS]
+
+# version, nombre d'échantillons, taille des entiers (4 ou 8) ; puis la première
+# valeur de chaque colonne (int64) ; puis les différences compressées
+_HEADER = struct.Struct('<BIB')
+_FIRST = struct.Struct(f'<{len(FIELDS)}q')
+
+INSERT_CHUNK = '''
+    INSERT INTO sample_chunks (object_id, current_set, exercise, weight,
+                               ts_start, ts_end, count, data, preview)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SELECT_CHUNKS = '''
+    SELECT current_set, count, {column} AS blob
+    FROM sample_chunks
+    WHERE object_id = ? AND ts_start <= ? AND ts_end >= ?
+    ORDER BY ts_start
+'''
+
+
+def create_schema(connection):
+    """Crée la table des blocs et son index (object_id, ts_start)"""
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS sample_chunks (
+            id INTEGER PRIMARY KEY,
+            object_id TEXT NOT NULL,
+            current_set INTEGER,
+            exercise TEXT,
+            weight REAL,
+            ts_start REAL NOT NULL, -- premier horodatage du bloc (epoch s)
+            ts_end REAL NOT NULL,   -- dernier horodatage du bloc (epoch s)
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL,     -- colonnes complètes (encode())
+            preview BLOB NOT NULL   -- aperçu LTTB, même format
+        )
+    ''')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS idx_sample_chunks_object_ts ON sample_chunks (object_id, ts_start)'
+    )
+
+
+def encode(series):
+    """Compresse des colonnes {champ: tableau} de même longueur"""
+    count = len(series['ts'])
+    matrix = np.empty((len(FIELDS), count), dtype=np.int64)
+    for index, field in enumerate(FIELDS):
+        matrix[index] = np.round(np.asarray(series[field], dtype=float) * SCALES.get(field, 1))
+    first = matrix[:, 0] if count else np.zeros(len(FIELDS), dtype=np.int64)
+    deltas = np.diff(matrix, axis=1, prepend=first[:, None])
+    width = 4 if count == 0 or np.abs(deltas).max() < 2 ** 31 else 8
+    body = deltas.astype(f'<i{width}').tobytes()
+    return _HEADER.pack(FORMAT_VERSION, count, width) + _FIRST.pack(*first.tolist()) + zlib.compress(body)
+
+
+def decode(blob):
+    """Inverse de encode() : {champ: tableau de float}"""
+    version, count, width = _HEADER.unpack_from(blob, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Version de bloc inconnue : {version}")
+    first = np.array(_FIRST.unpack_from(blob, _HEADER.size), dtype=np.int64)
+    body = zlib.decompress(blob[_HEADER.size + _FIRST.size:])
+    deltas = np.frombuffer(body, dtype=f'<i{width}').reshape(len(FIELDS), count)
+    matrix = np.cumsum(deltas, axis=1, dtype=np.int64) + first[:, None]
+    return {field: matrix[index] / SCALES.get(field, 1) for index, field in enumerate(FIELDS)}
+
+
+def lttb(x, y, threshold):
+    """Indices des `threshold` points retenus par Largest-Triangle-Three-Buckets"""
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    every = (count - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        # Sommet du triangle : moyenne du seau suivant
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(area))
+        indices[bucket + 1] = selected
+    indices[-1] = count - 1
+    return indices
+
+
+def _columns(rows):
+    """Lignes sample_row() -> {champ: tableau}"""
+    table = np.array([[row[index] for index in _ROW_INDEX] for row in rows], dtype=float)
+    table = np.nan_to_num(table)  # capteur absent (None) -> 0
+    return {field: table[:, index] for index, field in enumerate(FIELDS)}
+
+
+def _take(series, indices):
+    return {field: values[indices] for field, values in series.items()}
+
+
+def chunk_row(object_id, meta, rows):
+    """Paramètres de INSERT_CHUNK pour un bloc de lignes sample_row()"""
+    series = _columns(rows)
+    preview = _take(series, lttb(series['ts'], series[DEFAULT_FIELD], PREVIEW_POINTS))
+    current_set, exercise, weight = meta
+    return (object_id, current_set, exercise, weight, float(series['ts'][0]),
+            float(series['ts'][-1]), len(rows), encode(series), encode(preview))
+
+
+class _OpenChunk:
+    def __init__(self, meta):
+        self.meta = meta  # (current_set, exercise, weight)
+        self.rows = []
+        self.last_ts = None
+        self.last_seen = time.monotonic()
+
+
+class ChunkBuffer:
+    """Blocs en cours de remplissage, un par objet ; renvoie les blocs à écrire"""
+
+    def __init__(self, max_samples=CHUNK_MAX_SAMPLES, max_gap=CHUNK_MAX_GAP):
+        self.max_samples = max_samples
+        self.max_gap = max_gap
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def add(self, object_id, frame):
+        return self.add_row(object_id, samples.sample_row(object_id, frame))
+
+    def add_row(self, object_id, row):
+        """Ajoute une ligne sample_row() ; renvoie les paramètres des blocs terminés"""
+        ts = row[1]
+        meta = (row[4], row[2], row[3])
+        closed = []
+        with self._lock:
+            chunk = self._open.get(object_id)
+            # Nouvelle série, nouvel exercice ou longue pause : nouveau bloc
+            if chunk and (chunk.meta != meta or ts - chunk.last_ts > self.max_gap):
+                closed.append((object_id, self._open.pop(object_id)))
+                chunk = None
+            if chunk is None:
+                chunk = self._open[object_id] = _OpenChunk(meta)
+            chunk.rows.append(row)
+            chunk.last_ts = ts
+            chunk.last_seen = time.monotonic()
+            if len(chunk.rows) >= self.max_samples:
+                closed.append((object_id, self._open.pop(object_id)))
+        return [chunk_row(key, chunk.meta, chunk.rows) for key, chunk in closed]
+
+    def flush_idle(self, idle=CHUNK_IDLE_TIMEOUT):
+        """Termine les blocs des objets silencieux depuis `idle` secondes"""
+        now = time.monotonic()
+        with self._lock:
+            idle_ids = [key for key, chunk in self._open.items() if now - chunk.last_seen >= idle]
+            closed = [(key, self._open.pop(key)) for key in idle_ids]
+        return [chunk_row(key, chunk.meta, chunk.rows) for key, chunk in closed]
+
+    def flush_all(self):
+        with self._lock:
+            closed, self._open = list(self._open.items()), {}
+        return [chunk_row(key, chunk.meta, chunk.rows) for key, chunk in closed]
+
+    def pending(self, object_id):
+        """Bloc ouvert d'un objet (pas encore écrit) : (current_set, série) ou None"""
+        with self._lock:
+            chunk = self._open.get(object_id)
+            if chunk is None:
+                return None
+            meta, rows = chunk.meta, list(chunk.rows)
+        return meta[0], _columns(rows)
+
+
+def query_range(connection, object_id, start, end, points=DEFAULT_POINTS,
+                field=DEFAULT_FIELD, pending=None):
+    """
+    Séries d'un objet entre `start` et `end` (epoch s), réduites à `points`
+    points par LTTB sur `field` ; seuls les blocs qui chevauchent la période
+    sont lus, et leurs aperçus suffisent quand la période est longue
+    pending: bloc ouvert de ChunkBuffer.pending(), ajouté à la fin
+    """
+    total = connection.execute(
+        'SELECT COALESCE(SUM(count), 0) FROM sample_chunks WHERE object_id = ? AND ts_start <= ? AND ts_end >= ?',
+        (object_id, end, start)).fetchone()[0]
+    use_preview = total > points * PREVIEW_RATIO
+    rows = connection.execute(SELECT_CHUNKS.format(column='preview' if use_preview else 'data'),
+                              (object_id, end, start))
+
+    parts = [(row['current_set'], decode(row['blob'])) for row in rows]
+    if pending is not None:
+        parts.append(pending)
+
+    pieces = []
+    for current_set, series in parts:
+        mask = (series['ts'] >= start) & (series['ts'] <= end)
+        if mask.any():
+            series = _take(series, mask)
+            series['current_set'] = np.full(int(mask.sum()), current_set if current_set is not None else 0)
+            pieces.append(series)
+    if not pieces:
+        return {'source': 'preview' if use_preview else 'raw', 'count': 0, 'series': {}}
+
+    merged = {key: np.concatenate([piece[key] for piece in pieces]) for key in pieces[0]}
+    selected = _take(merged, lttb(merged['ts'], merged[field], points))
+    return {
+        'source': 'preview' if use_preview else 'raw',
+        'count': len(selected['ts']),
+        'series': {key: values.tolist() for key, values in selected.items()},
+    }
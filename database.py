@@ -1,11 +1,100 @@
+import queue
 import sqlite3
+import threading
 
-def initialize_db():
-    connection = sqlite3.connect("smart_dumbbell.db")
-    cursor = connection.cursor()
+import analytics
+import chunks
+import rollups
+import samples
 
+DATABASE = "smart_dumbbell.db"
+
+# Réglages appliqués à chaque connexion
+PRAGMAS = (
+    ('journal_mode', 'WAL'),        # lecteurs et écrivain ne se bloquent plus
+    ('synchronous', 'NORMAL'),      # sûr en WAL, sans fsync à chaque commit
+    ('cache_size', -16000),         # 16 Mio de cache de pages par connexion
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),         # ms d'attente si le fichier est verrouillé
+)
+STATEMENT_CACHE = 128  # requêtes préparées gardées par connexion
+POOL_SIZE = 16         # connexions inactives conservées
+
+# Requêtes fréquentes : des chaînes identiques réutilisent la requête préparée
+# en cache sur la connexion (cached_statements)
+SELECT_USER_BY_ID = 'SELECT * FROM users WHERE id = ?'
+SELECT_USER_LOGIN = 'SELECT * FROM users WHERE username = ? AND password = ?'
+SELECT_USER_OBJECTS = '''
+        SELECT o.id, o.name, o.state, o.last_seen, o.battery, o.temp
+        FROM objects o
+        JOIN users_objects uo ON o.id = uo.object_id
+        WHERE uo.user_id = ?
+    '''
+SELECT_USER_OBJECT_LINK = 'SELECT * FROM users_objects WHERE user_id = ? AND object_id = ?'
+INSERT_USER_OBJECT = 'INSERT INTO users_objects (user_id, object_id) VALUES (?, ?)'
+SELECT_OBJECT = 'SELECT * FROM objects WHERE id = ?'
+INSERT_OBJECT = 'INSERT INTO objects (id, name, state) VALUES (?, ?, ?)'
+SELECT_OBJECTS_OWNERS = 'SELECT DISTINCT user_id FROM users_objects WHERE object_id IN ({})'
+
+
+def configure(connection):
+    """Applique les PRAGMA de PRAGMAS à une connexion"""
+    for name, value in PRAGMAS:
+        connection.execute(f'PRAGMA {name}={value}')
+    return connection
+
+
+def connect(database=DATABASE):
+    connection = sqlite3.connect(database, cached_statements=STATEMENT_CACHE,
+                                 check_same_thread=False)
+    connection.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par nom
+    return configure(connection)
+
+
+class ConnectionPool:
+    """
+    Connexions réglées et réutilisées d'une requête à l'autre
+    chaque connexion n'est utilisée que par un thread à la fois : elle est
+    empruntée au début d'une requête et rendue à la fin
+    """
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE):
+        self.database = database
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.created += 1
+            return connect(self.database)
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()  # transaction oubliée par la requête
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# Migrations versionnées : (version, fonction) ; PRAGMA user_version garde la
+# dernière version appliquée, chaque migration est idempotente
+
+def _create_base_tables(connection):
     # Création de la table users
-    cursor.execute('''
+    connection.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,  -- Changement du type à TEXT
             name TEXT NOT NULL,
@@ -16,17 +105,17 @@ def initialize_db():
     ''')
 
     # Création de la table objects
-    cursor.execute('''
-        CREATE TABLE objects (
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS objects (
         id TEXT PRIMARY KEY, -- Identifiant unique pour chaque objet
         name TEXT,
         state TEXT
 );
     ''')
 
-    # Création de la table objects
-    cursor.execute('''
-        CREATE TABLE users_objects (
+    # Création de la table users_objects
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS users_objects (
             user_id TEXT, -- ID de l'utilisateur
             object_id TEXT, -- ID de l'objet
             PRIMARY KEY (user_id, object_id), -- Clé primaire composite
@@ -35,8 +124,86 @@ def initialize_db():
         );
     ''')
 
-    connection.commit()
-    connection.close()
 
-# Appeler cette fonction pour initialiser la base
-initialize_db()
+def _create_telemetry_tables(connection):
+    # Création de la table samples (historique des trames de capteurs)
+    samples.create_schema(connection)
+
+    # Création de la table set_metrics (métriques calculées par série)
+    analytics.create_schema(connection)
+
+    # Création des cumuls jour/semaine par utilisateur
+    rollups.create_schema(connection)
+
+
+def _add_indexes(connection):
+    # La clé primaire (user_id, object_id) couvre déjà les recherches par user_id ;
+    # les cumuls et la recherche des propriétaires d'un objet passent par object_id
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS idx_users_objects_object ON users_objects (object_id, user_id)'
+    )
+    connection.execute('ANALYZE')
+
+
+def _compress_samples(connection):
+    # Historique en blocs compressés par série ; les lignes déjà enregistrées
+    # dans `samples` sont converties puis supprimées
+    chunks.create_schema(connection)
+    buffer = chunks.ChunkBuffer()
+    columns = ', '.join(samples.COLUMNS)
+    for row in connection.execute(f'SELECT {columns} FROM samples ORDER BY object_id, ts'):
+        connection.executemany(chunks.INSERT_CHUNK, buffer.add_row(row[0], tuple(row)))
+    connection.executemany(chunks.INSERT_CHUNK, buffer.flush_all())
+    connection.execute('DELETE FROM samples')
+
+
+def _add_export_index(connection):
+    # Export par objet paginé sur l'id des blocs (voir export.py)
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS idx_sample_chunks_object_id ON sample_chunks (object_id, id)'
+    )
+
+
+def _add_health_columns(connection):
+    # État des objets tenu à jour par health.py : dernière trame, batterie, température
+    existing = {row[1] for row in connection.execute('PRAGMA table_info(objects)')}
+    for column, kind in (('last_seen', 'REAL'), ('battery', 'INTEGER'), ('temp', 'REAL')):
+        if column not in existing:
+            connection.execute(f'ALTER TABLE objects ADD COLUMN {column} {kind}')
+    connection.execute("UPDATE objects SET state = 'offline' WHERE state = 'off' OR state IS NULL")
+
+
+MIGRATIONS = (
+    (1, _create_base_tables),
+    (2, _create_telemetry_tables),
+    (3, _add_indexes),
+    (4, _compress_samples),
+    (5, _add_export_index),
+    (6, _add_health_columns),
+)
+
+
+def migrate(connection):
+    """Applique les migrations manquantes ; renvoie la version finale"""
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        with connection:
+            migration(connection)
+            connection.execute(f'PRAGMA user_version={target}')
+        version = target
+    return version
+
+
+def initialize_db(database=DATABASE):
+    connection = connect(database)
+    try:
+        return migrate(connection)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    # Appeler cette fonction pour initialiser la base
+    print(f"Schéma de {DATABASE} à la version {initialize_db()}")
@@ -0,0 +1,135 @@
+import queue
+import sqlite3
+import threading
+import time
+
+
+# Écrivain SQLite en arrière-plan : les requêtes HTTP déposent leurs écritures
+# dans une file et ce thread les valide par lots, en mode WAL.
+
+BATCH_SIZE = 500        # nombre maximal d'écritures par transaction
+FLUSH_INTERVAL = 0.2    # délai maximal (s) avant de valider un lot incomplet
+MAX_QUEUE = 100000      # au-delà, les nouvelles écritures sont rejetées
+
+_STOP = object()
+
+
+class BatchWriter(threading.Thread):
+    """Thread unique qui regroupe les écritures SQLite en transactions"""
+
+    def __init__(self, database, setup=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE, on_batch=None):
+        super().__init__(name='db-writer', daemon=True)
+        self.database = database
+        self.setup = setup  # fonction appelée avec la connexion avant la boucle
+        self.on_batch = on_batch  # fonction appelée avec (durée en s, lignes) après chaque lot
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.failed = 0   # écritures refusées par SQLite (reprise ligne par ligne)
+        self.written = 0
+
+    def submit(self, sql, params):
+        """Dépose une écriture sans attendre le disque ; False si la file est pleine"""
+        try:
+            self.queue.put_nowait((sql, params))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def after_commit(self, callback):
+        """Appelle `callback()` dans le thread d'écriture, une fois validées les écritures déjà déposées"""
+        try:
+            self.queue.put_nowait((None, callback))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self, timeout=5):
+        """Valide les écritures en attente puis arrête le thread"""
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join(timeout)
+
+    def run(self):
+        connection = sqlite3.connect(self.database)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        if self.setup:
+            self.setup(connection)
+            connection.commit()
+
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    running = False
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(connection, batch)
+
+        connection.close()
+
+    def _write(self, connection, batch):
+        """Exécute un lot dans une seule transaction, en regroupant les requêtes identiques"""
+        callbacks = [params for sql, params in batch if sql is None]
+        writes = [item for item in batch if item[0] is not None]
+        started = time.perf_counter()
+        try:
+            with connection:
+                start = 0
+                while start < len(writes):
+                    sql = writes[start][0]
+                    end = start
+                    while end < len(writes) and writes[end][0] == sql:
+                        end += 1
+                    connection.executemany(sql, [params for _, params in writes[start:end]])
+                    start = end
+            self.written += len(writes)
+        except sqlite3.Error as e:
+            # Le lot est annulé ; une ligne invalide ne doit pas faire perdre les autres
+            print(f"Erreur lors de l'écriture d'un lot de {len(writes)} lignes, reprise ligne par ligne : {e}")
+            self._write_each(connection, writes)
+        if self.on_batch and writes:
+            self.on_batch(time.perf_counter() - started, len(writes))
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Erreur dans un rappel après validation : {e}")
+
+    def _write_each(self, connection, writes):
+        """Rejoue un lot requête par requête dans une transaction, en écartant celles qui échouent"""
+        failed = 0
+        try:
+            with connection:
+                for sql, params in writes:
+                    try:
+                        connection.execute(sql, params)
+                    except sqlite3.Error as e:
+                        failed += 1
+                        print(f"Écriture écartée ({' '.join(sql.split()[:3])}) : {e}")
+            self.written += len(writes) - failed
+            self.failed += failed
+        except sqlite3.Error as e:
+            # Échec de la transaction elle-même (disque, verrou) : tout le lot est perdu
+            print(f"Erreur lors de la reprise d'un lot de {len(writes)} lignes : {e}")
+            self.failed += len(writes)
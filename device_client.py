@@ -0,0 +1,187 @@
+from collections import deque
+import socket
+import threading
+import time
+
+import framing
+
+
+# Canal de commandes serveur -> objets : connexions persistantes et tramées
+# (voir framing.py), regroupées par (ip, port). Délais de connexion et de
+# lecture bornés, vérification des connexions restées inactives, et attente
+# exponentielle après un échec pour qu'un objet injoignable ne bloque jamais
+# un worker Flask.
+
+CONNECT_TIMEOUT = 2.0     # s
+READ_TIMEOUT = 5.0        # s
+HEALTH_CHECK_AFTER = 30   # s d'inactivité avant de vérifier une connexion par 'ping'
+MAX_IDLE = 300            # s d'inactivité avant de fermer une connexion
+MAX_IDLE_PER_DEVICE = 4   # connexions inactives conservées par objet
+BACKOFF_BASE = 0.5        # s, doublé à chaque échec consécutif
+BACKOFF_MAX = 30.0        # s
+
+
+class DeviceUnavailable(Exception):
+    """L'objet est injoignable ou en période d'attente après un échec"""
+
+
+class DeviceConnection:
+    """Connexion tramée vers un objet"""
+
+    def __init__(self, address, connect_timeout, read_timeout):
+        self.address = address
+        self.read_timeout = read_timeout
+        self.sock = socket.create_connection(address, timeout=connect_timeout)
+        self.sock.settimeout(read_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.last_used = time.monotonic()
+
+    def send(self, commands):
+        """Envoie toutes les commandes d'un coup"""
+        self.sock.sendall(b''.join(framing.encode_message(command) for command in commands))
+
+    def receive(self, count):
+        """Lit `count` réponses dans l'ordre"""
+        replies = []
+        for _ in range(count):
+            reply = framing.recv_message(self.sock)
+            if reply is None:
+                raise framing.FramingError("Connexion fermée par l'objet")
+            replies.append(reply)
+        self.last_used = time.monotonic()
+        return replies
+
+    def exchange(self, commands):
+        """Envoie toutes les commandes d'un coup puis lit les réponses dans l'ordre"""
+        self.send(commands)
+        return self.receive(len(commands))
+
+    def is_stale(self):
+        """
+        Connexion inactive inutilisable : fermée ou réinitialisée par l'objet, ou
+        avec des octets inattendus en attente. Vérifié sans bloquer ni rien envoyer.
+        """
+        try:
+            self.sock.setblocking(False)
+            try:
+                self.sock.recv(1, socket.MSG_PEEK)
+                return True  # fin de flux ou octets inattendus
+            finally:
+                self.sock.settimeout(self.read_timeout)
+        except BlockingIOError:
+            return False  # rien à lire : la connexion est ouverte
+        except OSError:
+            return True
+
+    def is_healthy(self):
+        try:
+            return self.exchange(['ping']) == ['pong']
+        except (OSError, framing.FramingError):
+            return False
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class DeviceConnectionPool:
+    """Connexions persistantes indexées par (ip, port)"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_idle_per_device=MAX_IDLE_PER_DEVICE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle_per_device = max_idle_per_device
+        self._idle = {}      # (ip, port) -> deque de DeviceConnection
+        self._failures = {}  # (ip, port) -> (échecs consécutifs, reprise possible à)
+        self._lock = threading.Lock()
+
+    def _acquire(self, address):
+        """Connexion inactive encore valide, sinon nouvelle connexion ; (connexion, réutilisée)"""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                idle = self._idle.get(address)
+                connection = idle.pop() if idle else None
+            if connection is None:
+                break
+            age = now - connection.last_used
+            # Fermée par l'objet pendant l'inactivité : vu sans rien envoyer
+            if age < MAX_IDLE and not connection.is_stale():
+                if age < HEALTH_CHECK_AFTER or connection.is_healthy():
+                    return connection, True
+            connection.close()
+        return DeviceConnection(address, self.connect_timeout, self.read_timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            idle = self._idle.setdefault(connection.address, deque())
+            if len(idle) < self.max_idle_per_device:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _check_backoff(self, address):
+        failures = self._failures.get(address)
+        if failures and time.monotonic() < failures[1]:
+            raise DeviceUnavailable(
+                f"{address[0]}:{address[1]} injoignable, nouvel essai dans "
+                f"{failures[1] - time.monotonic():.1f} s"
+            )
+
+    def _record_failure(self, address):
+        with self._lock:
+            count = self._failures.get(address, (0, 0))[0] + 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (count - 1))
+            self._failures[address] = (count, time.monotonic() + delay)
+
+    def request(self, ip, port, *commands):
+        """Envoie une ou plusieurs commandes en pipeline ; renvoie les réponses"""
+        try:
+            address = (ip, int(port))
+        except (TypeError, ValueError) as e:
+            raise DeviceUnavailable(f"Adresse invalide {ip}:{port}") from e
+        self._check_backoff(address)
+        # Un seul nouvel essai, et seulement si l'objet n'a pas pu recevoir les
+        # commandes : connexion réutilisée fermée par l'objet pendant l'envoi.
+        # Jamais après un délai dépassé ou une fois l'envoi terminé ('use' en double).
+        for attempt in range(2):
+            try:
+                connection, reused = self._acquire(address)
+            except OSError as e:
+                self._record_failure(address)
+                raise DeviceUnavailable(f"Connexion à {ip}:{port} impossible : {e}") from e
+            try:
+                connection.send(commands)
+            except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                self._record_failure(address)
+                raise DeviceUnavailable(f"Envoi à {ip}:{port} interrompu : {e}") from e
+            except OSError as e:
+                connection.close()
+                self._record_failure(address)
+                raise DeviceUnavailable(f"Envoi à {ip}:{port} interrompu : {e}") from e
+            try:
+                replies = connection.receive(len(commands))
+            except (OSError, framing.FramingError) as e:
+                connection.close()
+                self._record_failure(address)
+                raise DeviceUnavailable(f"Échange avec {ip}:{port} interrompu : {e}") from e
+            self._failures.pop(address, None)
+            self._release(connection)
+            return replies
+
+    def command(self, ip, port, command):
+        """Envoie une commande unique et renvoie sa réponse"""
+        return self.request(ip, port, command)[0]
+
+    def close(self):
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            for connection in idle:
+                connection.close()
@@ -0,0 +1,147 @@
+import math
+import time
+
+# On-device filtering between calculate_positions() and the sender
+#
+# Sensor coordinates are smoothed (EMA or one-euro filter) to remove the
+# jitter of the simulated sensors, then a deadband drops frames in which no
+# sensor moved more than `deadband` metres since the last frame sent. The
+# server keeps the last value it received until the next frame, so a keyframe
+# is still sent every `keyframe_interval` seconds (liveness, battery,
+# temperature) and whenever the set or repetition changes.
+
+SMOOTHING = 'one_euro'    # 'ema', 'one_euro' or None
+EMA_ALPHA = 0.5           # weight of the newest sample
+ONE_EURO_MIN_CUTOFF = 1.0  # Hz, cutoff when the dumbbell is still
+ONE_EURO_BETA = 10.0       # cutoff increase per m/s of speed
+ONE_EURO_D_CUTOFF = 1.0    # Hz, cutoff of the speed estimate
+DEADBAND = 0.03           # metres a sensor must move for a frame to be sent
+KEYFRAME_INTERVAL = 1.0   # seconds between frames sent regardless of movement
+
+# Frame fields whose change always goes through (rep and set boundaries)
+CONTEXT_FIELDS = ('exercise', 'weight', 'current_set', 'current_rep', 'total_reps')
+
+
+class Ema:
+    """Exponential moving average of one value"""
+
+    def __init__(self, alpha=EMA_ALPHA):
+        self.alpha = alpha
+        self.value = None
+
+    def __call__(self, value, now):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+def _smoothing_factor(cutoff, elapsed):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / elapsed)
+
+
+class OneEuro:
+    """
+    One-euro filter (Casiez et al., 2012): an EMA whose cutoff frequency rises
+    with speed, so a still dumbbell is smoothed hard and a moving one lags little
+    """
+
+    def __init__(self, min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA,
+                 d_cutoff=ONE_EURO_D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = None
+        self.speed = 0.0
+        self.last_time = None
+
+    def __call__(self, value, now):
+        if self.value is None:
+            self.value, self.last_time = value, now
+            return value
+        elapsed = now - self.last_time
+        if elapsed <= 0:
+            return self.value
+        self.last_time = now
+        speed = (value - self.value) / elapsed
+        self.speed += _smoothing_factor(self.d_cutoff, elapsed) * (speed - self.speed)
+        cutoff = self.min_cutoff + self.beta * abs(self.speed)
+        self.value += _smoothing_factor(cutoff, elapsed) * (value - self.value)
+        return self.value
+
+
+FILTERS = {'ema': Ema, 'one_euro': OneEuro}
+
+
+class FrameFilter:
+    """
+    Smooths the `sensors` of workout frames and drops those below the deadband
+    process() returns the frame to send, or None when it is suppressed
+    """
+
+    def __init__(self, smoothing=SMOOTHING, deadband=DEADBAND,
+                 keyframe_interval=KEYFRAME_INTERVAL, **filter_options):
+        if smoothing is not None and smoothing not in FILTERS:
+            raise ValueError(f"Unknown smoothing {smoothing!r}, expected one of {sorted(FILTERS)}")
+        self.smoothing = smoothing
+        self.deadband = deadband
+        self.keyframe_interval = keyframe_interval
+        self.filter_options = filter_options
+        self._filters = {}      # (sensor, axis) -> filter
+        self._last_sent = None  # last frame sent
+        self._last_time = None  # when it was sent
+        self.passed = 0
+        self.suppressed = 0
+
+    def _smooth(self, sensors, now):
+        if self.smoothing is None:
+            return sensors
+        smoothed = {}
+        for sensor, position in sensors.items():
+            smoothed[sensor] = {}
+            for axis, value in position.items():
+                if value is None:
+                    smoothed[sensor][axis] = None
+                    continue
+                key = (sensor, axis)
+                smoother = self._filters.get(key)
+                if smoother is None:
+                    smoother = self._filters[key] = FILTERS[self.smoothing](**self.filter_options)
+                smoothed[sensor][axis] = round(smoother(value, now), 3)
+        return smoothed
+
+    def _movement(self, sensors):
+        """Largest displacement of a sensor since the last frame sent (metres)"""
+        previous = self._last_sent['sensors']
+        largest = 0.0
+        for sensor, position in sensors.items():
+            before = previous.get(sensor)
+            if before is None or None in position.values() or None in before.values():
+                return math.inf
+            largest = max(largest, math.sqrt(sum((position[axis] - before.get(axis, 0)) ** 2
+                                                 for axis in position)))
+        return largest
+
+    def _must_send(self, frame, now):
+        last = self._last_sent
+        if last is None or now - self._last_time >= self.keyframe_interval:
+            return True
+        if any(frame.get(field) != last.get(field) for field in CONTEXT_FIELDS):
+            return True
+        if 'sensors' not in frame:
+            return True
+        return self._movement(frame['sensors']) >= self.deadband
+
+    def process(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        if 'sensors' in frame:
+            frame = dict(frame, sensors=self._smooth(frame['sensors'], now))
+        if not self._must_send(frame, now):
+            self.suppressed += 1
+            return None
+        self._last_sent = frame
+        self._last_time = now
+        self.passed += 1
+        return frame
@@ -0,0 +1,132 @@
+import base64
+import csv
+import io
+import json
+
+import numpy as np
+
+import chunks
+
+
+# Export en flux de l'historique des capteurs (/api/export), en NDJSON ou CSV.
+# Les blocs sont lus par lots de taille fixe (pagination par clé : object_id
+# puis id), chaque lot dans sa propre courte lecture : la mémoire ne dépend pas
+# de la taille de l'export et les écritures en WAL ne sont jamais bloquées.
+# Chaque enregistrement porte un jeton `cursor` ; le repasser à /api/export
+# reprend l'export juste après cet enregistrement.
+
+EXPORT_BATCH = 50  # blocs lus par requête SQL
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+COLUMNS = ('object_id', 'current_set', 'exercise', 'weight') + chunks.FIELDS + ('cursor',)
+
+SELECT_EXPORT_CHUNKS = '''
+    SELECT id, object_id, current_set, exercise, weight, data
+    FROM sample_chunks
+    WHERE object_id = ? AND id > ? AND ts_end >= ? AND ts_start <= ?
+    ORDER BY id
+    LIMIT ?
+'''
+SELECT_RESUME_CHUNK = '''
+    SELECT id, object_id, current_set, exercise, weight, data
+    FROM sample_chunks
+    WHERE id = ? AND object_id = ?
+'''
+
+
+def encode_cursor(object_id, chunk_id, index):
+    """Jeton opaque : position de l'enregistrement (objet, bloc, rang dans le bloc)"""
+    raw = json.dumps([object_id, chunk_id, index], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse de encode_cursor() ; ValueError si le jeton est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        object_id, chunk_id, index = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Jeton de reprise invalide : {token}") from e
+    if not isinstance(object_id, str) or not isinstance(chunk_id, int) or not isinstance(index, int):
+        raise ValueError(f"Jeton de reprise invalide : {token}")
+    return object_id, chunk_id, index
+
+
+def _chunk_records(row, start, end, after_index=-1):
+    """Enregistrements (dict) d'un bloc dans la période, après le rang `after_index`"""
+    series = chunks.decode(row['data'])
+    positions = np.arange(len(series['ts']))
+    mask = (series['ts'] >= start) & (series['ts'] <= end) & (positions > after_index)
+    if not mask.any():
+        return []
+    object_id, chunk_id = row['object_id'], row['id']
+    meta = {'object_id': object_id, 'current_set': row['current_set'],
+            'exercise': row['exercise'], 'weight': row['weight']}
+    columns = [series[field][mask].tolist() for field in chunks.FIELDS]
+    records = []
+    for index, values in zip(positions[mask].tolist(), zip(*columns)):
+        record = dict(meta)
+        record.update(zip(chunks.FIELDS, values))
+        record['cursor'] = encode_cursor(object_id, chunk_id, index)
+        records.append(record)
+    return records
+
+
+def iter_chunk_records(pool, object_ids, start, end, cursor=None, batch=EXPORT_BATCH):
+    """
+    Enregistrements des objets `object_ids`, bloc par bloc (une liste par bloc)
+    une connexion du pool est empruntée le temps de chaque lot seulement
+    """
+    object_ids = sorted(object_ids)
+    resume = decode_cursor(cursor) if cursor else None
+    if resume:
+        object_ids = [object_id for object_id in object_ids if object_id >= resume[0]]
+
+    for object_id in object_ids:
+        last_id = 0
+        if resume and object_id == resume[0]:
+            _, last_id, index = resume
+            connection = pool.acquire()
+            try:
+                row = connection.execute(SELECT_RESUME_CHUNK, (last_id, object_id)).fetchone()
+            finally:
+                pool.release(connection)
+            if row is not None:
+                records = _chunk_records(row, start, end, index)
+                if records:
+                    yield records
+
+        while True:
+            connection = pool.acquire()
+            try:
+                rows = connection.execute(SELECT_EXPORT_CHUNKS,
+                                          (object_id, last_id, start, end, batch)).fetchall()
+            finally:
+                pool.release(connection)
+            for row in rows:
+                records = _chunk_records(row, start, end)
+                if records:
+                    yield records
+            if len(rows) < batch:
+                break
+            last_id = rows[-1]['id']
+
+
+def ndjson_stream(record_batches):
+    for records in record_batches:
+        yield ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def csv_stream(record_batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    yield buffer.getvalue()
+    for records in record_batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(records)
+        yield buffer.getvalue()
+
+
+STREAMS = {'ndjson': ndjson_stream, 'csv': csv_stream}
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from IoT_object import object_info, REPS_PER_SET, TOTAL_SETS, REP_DURATION, SERVER_URL
+from async_device import AsyncDevice, AsyncHTTPClient, SendStats
+
+# Fleet simulator: runs N virtual dumbbells in one asyncio process to
+# reproduce production ingest load against a local server.
+#
+#   python fleet.py --devices 500 --rate 20 --time-scale 5 --zero-rest
+#
+# Devices filter their frames as real ones do (smoothing and deadband, see
+# edge_filter.py), so fewer than --rate frames per second reach the server;
+# --no-filter sends every sample.
+
+MAX_DEVICES = 10000
+REPORT_INTERVAL = 5.0  # seconds between progress lines
+
+
+class FleetStats(SendStats):
+    """Send counters shared by every device, plus registration results"""
+
+    def __init__(self):
+        super().__init__()
+        self.registered = 0
+        self.registration_errors = 0
+        self.active = 0
+        self.finished = 0
+
+
+def device_info(prefix, index):
+    """Registration payload of the index-th virtual device"""
+    info = dict(object_info)
+    info['id'] = f"{prefix}-{index:05d}"
+    info['name'] = f"{object_info['name']} #{index}"
+    return info
+
+
+async def register(client, info, stats):
+    """Announce one device through /handle_info over a shared keep-alive connection"""
+    try:
+        status = await client.post('/handle_info', json.dumps(info).encode('utf-8'),
+                                   {'Content-Type': 'application/json'})
+    except Exception as e:
+        status = None
+        stats.last_error = repr(e)
+    if status == 200:
+        stats.registered += 1
+        return True
+    stats.registration_errors += 1
+    return False
+
+
+async def run_device(info, delay, args, stats):
+    """Wait for its staggered start, register, then run one workout"""
+    await asyncio.sleep(delay)
+    client = AsyncHTTPClient(args.server)
+    try:
+        await register(client, info, stats)
+    finally:
+        await client.close()
+
+    device = AsyncDevice(info, server_url=args.server,
+                         frame_format='binary' if args.binary else 'json', verbose=False)
+    stats.active += 1
+    try:
+        await device.run_workout(
+            total_sets=args.sets,
+            reps_per_set=args.reps,
+            rep_duration=REP_DURATION,
+            rest=0 if args.zero_rest else args.rest,
+            frames_per_rep=max(4, round(args.rate * REP_DURATION)),
+            time_scale=args.time_scale,
+            stats=stats,
+            filter_frames=not args.no_filter,
+        )
+    finally:
+        stats.active -= 1
+        stats.finished += 1
+
+
+async def report(stats, started, interval):
+    """Print achieved send rate and error counts until cancelled"""
+    last_frames, last_generated, last_time = 0, 0, started
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        rate = (stats.frames_sent - last_frames) / (now - last_time)
+        generated = (stats.frames_generated - last_generated) / (now - last_time)
+        last_frames, last_generated, last_time = stats.frames_sent, stats.frames_generated, now
+        print(f"[{now - started:7.1f}s] active={stats.active} finished={stats.finished} "
+              f"frames/s={rate:9.1f} generated/s={generated:9.1f} "
+              f"sent={stats.frames_sent} suppressed={stats.frames_suppressed} failed={stats.frames_failed} "
+              f"requests={stats.requests} errors={stats.errors} "
+              f"registration_errors={stats.registration_errors}", flush=True)
+
+
+async def run_fleet(args):
+    stats = FleetStats()
+    prefix = args.prefix or f"fleet-{uuid.uuid4().hex[:8]}"
+    started = time.monotonic()
+    reporter = asyncio.create_task(report(stats, started, args.report_interval))
+    devices = [
+        run_device(device_info(prefix, index),
+                   index * args.stagger / args.devices + random.uniform(0, args.jitter),
+                   args, stats)
+        for index in range(args.devices)
+    ]
+    try:
+        await asyncio.gather(*devices)
+    finally:
+        reporter.cancel()
+
+    elapsed = time.monotonic() - started
+    summary = {
+        'devices': args.devices,
+        'elapsed_s': round(elapsed, 2),
+        'filtered': not args.no_filter,
+        'frames_generated': stats.frames_generated,
+        'frames_suppressed': stats.frames_suppressed,
+        'frames_sent': stats.frames_sent,
+        'frames_failed': stats.frames_failed,
+        'frames_per_s': round(stats.frames_sent / elapsed, 1) if elapsed else 0,
+        'generated_per_s': round(stats.frames_generated / elapsed, 1) if elapsed else 0,
+        'requests': stats.requests,
+        'errors': stats.errors,
+        'registered': stats.registered,
+        'registration_errors': stats.registration_errors,
+        'last_error': stats.last_error,
+    }
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fleet of simulated smart dumbbells")
+    parser.add_argument('--devices', type=int, default=10,
+                        help=f"number of virtual devices (1-{MAX_DEVICES})")
+    parser.add_argument('--server', default=SERVER_URL, help="base URL of the Flask server")
+    parser.add_argument('--rate', type=float, default=20 / REP_DURATION,
+                        help="frames sampled per second per device (fewer are sent unless --no-filter)")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="time compression factor (10 = ten times faster than real time)")
+    parser.add_argument('--sets', type=int, default=TOTAL_SETS)
+    parser.add_argument('--reps', type=int, default=REPS_PER_SET)
+    parser.add_argument('--rest', type=float, default=30, help="rest between sets, in seconds")
+    parser.add_argument('--zero-rest', action='store_true', help="chain sets without resting")
+    parser.add_argument('--stagger', type=float, default=5.0,
+                        help="spread device start times over this many seconds")
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help="random extra start delay per device, in seconds")
+    parser.add_argument('--binary', action='store_true', help="send packed binary frames")
+    parser.add_argument('--no-filter', action='store_true',
+                        help="send every sample instead of smoothing and deadbanding them")
+    parser.add_argument('--prefix', help="device id prefix (random by default)")
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL)
+    args = parser.parse_args(argv)
+    if not 1 <= args.devices <= MAX_DEVICES:
+        parser.error(f"--devices must be between 1 and {MAX_DEVICES}")
+    if args.rate <= 0 or args.time_scale <= 0:
+        parser.error("--rate and --time-scale must be positive")
+    return args
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(run_fleet(parse_args()))
+    except KeyboardInterrupt:
+        print("\nFleet stopped by user")
@@ -0,0 +1,105 @@
+import struct
+
+from samples import SENSORS, AXES, parse_timestamp
+
+# Compact binary encoding of a workout frame (shared by the device and the server)
+#
+# Fixed little-endian layout, 68 bytes per frame:
+#   version      uint8
+#   timestamp    float64  epoch seconds
+#   current_set  uint16
+#   current_rep  uint16
+#   total_reps   uint32
+#   coordinates  12 x float32  (left_dumbbell, right_dumbbell, left_elbow, right_elbow) x (x, y, z)
+#   temp         int16    tenths of a degree
+#   battery      uint8    percent
+#
+# Per-device fields that never change during a workout (object_id, exercise,
+# weight) travel in the X-Object-Id, X-Exercise and X-Weight headers instead.
+
+CONTENT_TYPE = 'application/x-dumbbell-frame'
+VERSION = 1
+
+FRAME = struct.Struct('<BdHHI12fhB')
+FRAME_SIZE = FRAME.size
+
+
+def encode_frame(data):
+    """Pack a JSON-style frame dict into FRAME_SIZE bytes"""
+    sensors = data['sensors']
+    coords = [sensors[sensor][axis] for sensor in SENSORS for axis in AXES]
+    timestamp = data['timestamp']
+    if not isinstance(timestamp, (int, float)):
+        timestamp = parse_timestamp(timestamp)
+    return FRAME.pack(
+        VERSION,
+        timestamp,
+        data['current_set'],
+        data['current_rep'],
+        data['total_reps'],
+        *coords,
+        round(data['temp'] * 10),
+        data['battery'],
+    )
+
+
+def encode_frames(frames):
+    """Concatenate several packed frames into one payload"""
+    return b''.join(encode_frame(data) for data in frames)
+
+
+def _to_dict(values, fields):
+    version, timestamp, current_set, current_rep, total_reps = values[:5]
+    if version != VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    coords = values[5:17]
+    sensors = {}
+    for index, sensor in enumerate(SENSORS):
+        offset = index * 3
+        sensors[sensor] = {axis: round(coords[offset + i], 3) for i, axis in enumerate(AXES)}
+    data = dict(fields)
+    data.update({
+        'timestamp': timestamp,
+        'current_set': current_set,
+        'current_rep': current_rep,
+        'total_reps': total_reps,
+        'sensors': sensors,
+        'temp': values[17] / 10,
+        'battery': values[18],
+    })
+    return data
+
+
+def decode_frames(payload, fields=None):
+    """
+    Unpack a payload of one or more frames into JSON-style dicts
+    fields: per-device values (object_id, exercise, weight) merged into each frame
+    """
+    if not payload or len(payload) % FRAME_SIZE:
+        raise ValueError(f"Payload size {len(payload)} is not a multiple of {FRAME_SIZE}")
+    fields = fields or {}
+    return [_to_dict(values, fields) for values in FRAME.iter_unpack(payload)]
+
+
+def header_fields(headers):
+    """Extract the per-device fields from request headers"""
+    fields = {}
+    if headers.get('X-Object-Id'):
+        fields['object_id'] = headers['X-Object-Id']
+    if headers.get('X-Exercise'):
+        fields['exercise'] = headers['X-Exercise']
+    if headers.get('X-Weight'):
+        fields['weight'] = float(headers['X-Weight'])
+    return fields
+
+
+def frame_headers(data):
+    """Headers carrying the per-device fields of a frame"""
+    headers = {'Content-Type': CONTENT_TYPE}
+    if data.get('object_id'):
+        headers['X-Object-Id'] = str(data['object_id'])
+    if data.get('exercise'):
+        headers['X-Exercise'] = str(data['exercise'])
+    if data.get('weight') is not None:
+        headers['X-Weight'] = str(data['weight'])
+    return headers
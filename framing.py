@@ -0,0 +1,82 @@
+import asyncio
+import struct
+
+# Length-prefixed framing for the server <-> device command channel
+# Each message is a 4-byte big-endian length followed by a UTF-8 payload, so
+# several commands can share one connection and be pipelined.
+
+HEADER = struct.Struct('>I')
+MAX_MESSAGE = 64 * 1024  # bytes
+
+
+class FramingError(Exception):
+    """Raised when the peer sends a malformed frame or closes mid-frame"""
+
+
+def encode_message(text):
+    """Prefix a command or reply with its length"""
+    payload = text.encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_message(sock, text):
+    sock.sendall(encode_message(text))
+
+
+def recv_exact(sock, size):
+    """Read exactly `size` bytes; returns b'' if the peer closed before the first byte"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            if remaining == size:
+                return b''
+            raise FramingError("Connection closed in the middle of a frame")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    """Read one framed message; returns None when the peer closed the connection"""
+    header = recv_exact(sock, HEADER.size)
+    if not header:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise FramingError(f"Frame of {length} bytes exceeds the {MAX_MESSAGE} byte limit")
+    payload = recv_exact(sock, length) if length else b''
+    if length and not payload:
+        raise FramingError("Connection closed in the middle of a frame")
+    return payload.decode('utf-8')
+
+
+def is_legacy_command(prefix):
+    """Old clients send a bare 'use' / 'act ...' string without a length prefix"""
+    return prefix.startswith(b'use') or prefix.startswith(b'act')
+
+
+# asyncio variants, for the device-side asyncio server
+
+async def read_message(reader):
+    """Read one framed message from an asyncio StreamReader; None on clean EOF"""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise FramingError("Connection closed in the middle of a frame") from e
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise FramingError(f"Frame of {length} bytes exceeds the {MAX_MESSAGE} byte limit")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise FramingError("Connection closed in the middle of a frame") from e
+    return payload.decode('utf-8')
+
+
+async def write_message(writer, text):
+    writer.write(encode_message(text))
+    await writer.drain()
@@ -0,0 +1,214 @@
+import math
+import threading
+import time
+
+
+# Suivi de l'état des objets : dernière trame, batterie, température.
+# Le passage à l'inactivité est détecté par une roue temporelle : chaque objet
+# y est inscrit une seule fois, à l'échéance de son état courant, et chaque
+# tic n'examine que le seau qui arrive à échéance (pas de parcours de tous les
+# objets). Une trame ne fait que mettre à jour quelques champs ; l'échéance est
+# recalculée quand le seau de l'objet est atteint. Un objet hors ligne est
+# inscrit une dernière fois à la fin de RETENTION, puis oublié (il reste en base).
+# Les changements sont écrits dans `objects` par lots d'UPDATE.
+
+ONLINE = 'online'            # annoncé ou vu récemment, sans séance en cours
+USING = 'using'              # trames reçues il y a moins de USING_TIMEOUT
+LOW_BATTERY = 'low-battery'  # joignable mais batterie sous LOW_BATTERY_LEVEL
+OFFLINE = 'offline'          # rien reçu depuis OFFLINE_TIMEOUT
+
+USING_TIMEOUT = 10       # s sans trame avant de repasser « online »
+OFFLINE_TIMEOUT = 120    # s sans nouvelles avant « offline »
+RETENTION = 24 * 3600    # s sans nouvelles avant d'oublier un objet hors ligne
+LOW_BATTERY_LEVEL = 20   # % de batterie
+TICK = 1.0               # s par seau de la roue
+WHEEL_SIZE = 256         # seaux (les échéances plus lointaines font plusieurs tours)
+FLUSH_INTERVAL = 30      # s entre deux écritures de batterie / température
+
+UPDATE_STATE = '''
+    UPDATE objects SET state = ?, last_seen = ?, battery = ?, temp = ?
+    WHERE id = ? AND (last_seen IS NULL OR last_seen <= ?)
+'''
+SELECT_ACTIVE = "SELECT id, state, last_seen, battery, temp FROM objects WHERE state != 'offline' AND last_seen IS NOT NULL"
+
+
+class TimingWheel:
+    """Roue temporelle hachée : schedule() et chaque tic en temps constant par entrée"""
+
+    def __init__(self, tick=TICK, size=WHEEL_SIZE, now=None):
+        self.tick = tick
+        self.size = size
+        self.buckets = [[] for _ in range(size)]
+        self.current = int((time.monotonic() if now is None else now) / tick)
+
+    def schedule(self, item, deadline):
+        """Inscrit `item` pour l'échéance `deadline` (même horloge que advance) ; renvoie son tic"""
+        due = max(math.ceil(deadline / self.tick), self.current + 1)
+        self.buckets[due % self.size].append((due, item))
+        return due
+
+    def advance(self, now):
+        """Fait tourner la roue jusqu'à `now` ; renvoie les (tic, élément) arrivés à échéance"""
+        target = int(now / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            index = self.current % self.size
+            bucket = self.buckets[index]
+            if not bucket:
+                continue
+            later = [(due, item) for due, item in bucket if due > self.current]
+            expired.extend(entry for entry in bucket if entry[0] <= self.current)
+            self.buckets[index] = later
+        return expired
+
+
+class _Device:
+    __slots__ = ('object_id', 'state', 'last_seen', 'last_frame', 'seen_at',
+                 'battery', 'temp', 'due')
+
+    def __init__(self, object_id):
+        self.object_id = object_id
+        self.state = None
+        self.last_seen = None    # horloge monotone
+        self.last_frame = None   # horloge monotone, dernière trame de capteurs
+        self.seen_at = None      # epoch, écrit dans objects.last_seen
+        self.battery = None
+        self.temp = None
+        self.due = None          # tic de la roue où l'objet est inscrit
+
+
+class HealthTracker:
+    """État courant de chaque objet et changements à écrire en base"""
+
+    def __init__(self, using_timeout=USING_TIMEOUT, offline_timeout=OFFLINE_TIMEOUT,
+                 low_battery=LOW_BATTERY_LEVEL, tick=TICK, wheel_size=WHEEL_SIZE,
+                 retention=RETENTION):
+        self.using_timeout = using_timeout
+        self.offline_timeout = offline_timeout
+        self.retention = retention
+        self.low_battery = low_battery
+        self.wheel = TimingWheel(tick, wheel_size)
+        self._devices = {}
+        self._dirty = set()    # objets dont batterie / température / dernière trame ont changé
+        self._changed = set()  # objets qui ont changé d'état
+        self._lock = threading.Lock()
+
+    def _evaluate(self, device, now):
+        """État attendu et prochaine échéance (None : plus rien à surveiller)"""
+        idle = now - device.last_seen
+        if idle >= self.offline_timeout:
+            # Réexaminé une dernière fois à la fin de la rétention, pour être oublié
+            return OFFLINE, (device.last_seen + self.retention if idle < self.retention else None)
+        low = device.battery is not None and device.battery < self.low_battery
+        if device.last_frame is not None and now - device.last_frame < self.using_timeout:
+            return (LOW_BATTERY if low else USING), device.last_frame + self.using_timeout
+        return (LOW_BATTERY if low else ONLINE), device.last_seen + self.offline_timeout
+
+    def _update(self, device, now):
+        state, deadline = self._evaluate(device, now)
+        if state != device.state:
+            device.state = state
+            self._changed.add(device.object_id)
+        # Une échéance plus proche (début de séance) remplace l'inscription en cours
+        if deadline is not None and (device.due is None or deadline < device.due * self.wheel.tick):
+            device.due = self.wheel.schedule(device, deadline)
+
+    def _device(self, object_id):
+        device = self._devices.get(object_id)
+        if device is None:
+            device = self._devices[object_id] = _Device(object_id)
+        return device
+
+    def observe(self, object_id, frame, now=None):
+        """Trame de capteurs reçue : quelques affectations, sans E/S"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            device = self._device(object_id)
+            device.last_seen = device.last_frame = now
+            device.seen_at = time.time()
+            battery, temp = frame.get('battery'), frame.get('temp')
+            if battery is not None:
+                device.battery = battery
+            if temp is not None:
+                device.temp = temp
+            self._dirty.add(object_id)
+            # Avec une trame toute fraîche l'état attendu est connu d'avance :
+            # la roue n'est sollicitée qu'au début d'une séance ou au seuil de batterie
+            low = device.battery is not None and device.battery < self.low_battery
+            if device.state != (LOW_BATTERY if low else USING):
+                self._update(device, now)
+            elif device.due is None:
+                device.due = self.wheel.schedule(device, now + self.using_timeout)
+
+    def mark_online(self, object_id, now=None):
+        """Objet annoncé ou joignable (enregistrement, ping)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            device = self._device(object_id)
+            device.last_seen = now
+            device.seen_at = time.time()
+            self._dirty.add(object_id)
+            self._update(device, now)
+
+    def load(self, rows, now=None):
+        """Reprend les objets actifs enregistrés en base (SELECT_ACTIVE) au démarrage"""
+        now = time.monotonic() if now is None else now
+        wall = time.time()
+        with self._lock:
+            for row in rows:
+                device = self._device(row['id'])
+                device.state = row['state']
+                device.seen_at = row['last_seen']
+                device.last_seen = now - max(0.0, wall - row['last_seen'])
+                if row['state'] in (USING, LOW_BATTERY):
+                    device.last_frame = device.last_seen
+                device.battery, device.temp = row['battery'], row['temp']
+                self._update(device, now)
+
+    def advance(self, now=None):
+        """Tic de la roue : réévalue les objets arrivés à échéance"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for due, device in self.wheel.advance(now):
+                if device.due != due:
+                    continue  # inscription remplacée par une échéance plus proche
+                device.due = None
+                self._update(device, now)
+                if device.state == OFFLINE and now - device.last_seen >= self.retention:
+                    if self._devices.get(device.object_id) is device:
+                        del self._devices[device.object_id]
+
+    def collect(self, include_telemetry=True):
+        """
+        Paramètres de UPDATE_STATE pour les objets qui ont changé d'état (et ceux
+        dont la télémétrie a changé si `include_telemetry`), et ids des objets
+        qui ont changé d'état
+        """
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            if include_telemetry:
+                ids, self._dirty = changed | self._dirty, set()
+            else:
+                ids = changed
+                self._dirty -= changed
+            rows = []
+            for object_id in ids:
+                device = self._devices.get(object_id)
+                if device is None:
+                    continue  # oublié après la rétention
+                rows.append((device.state, device.seen_at, device.battery, device.temp,
+                             object_id, device.seen_at))
+        return rows, changed
+
+    def state(self, object_id):
+        device = self._devices.get(object_id)
+        return device.state if device else None
+
+    def state_counts(self):
+        counts = {ONLINE: 0, USING: 0, LOW_BATTERY: 0, OFFLINE: 0}
+        with self._lock:
+            for device in self._devices.values():
+                if device.state in counts:
+                    counts[device.state] += 1
+        return counts
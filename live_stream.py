@@ -0,0 +1,219 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+
+# Flux /workout incrémental : chaque connexion reçoit d'abord l'état complet de
+# l'objet (événement `snapshot`), puis seulement les champs qui ont changé, sous
+# forme de patch JSON (RFC 7386 : un champ à null a été retiré). Les trames
+# reçues par ce processus portent un id ; les dernières trames de chaque objet
+# sont gardées dans un anneau pour qu'un client qui se reconnecte avec
+# Last-Event-ID reçoive ce qu'il a manqué ; le flux de tous les objets reprend
+# depuis un anneau commun. Un client qui déclare une fréquence
+# de rafraîchissement (`rate`) ne reçoit pas plus d'une mise à jour par
+# intervalle et par objet : les trames intermédiaires sont fusionnées.
+
+REPLAY_SIZE = 128          # trames gardées par objet pour la reprise (~6 s à 20 trames/s)
+GLOBAL_REPLAY_SIZE = 4096  # trames gardées, tous objets confondus, pour le flux de tous les objets
+MAX_RINGS = 256            # anneaux par objet gardés au plus (les moins récents sont retirés)
+RING_IDLE = 60             # s sans trame avant de retirer l'anneau d'un objet
+MAX_RATE = 100      # rafraîchissements par seconde acceptés au plus
+
+# Préfixe des ids : un id d'un autre processus (autre worker, redémarrage) est
+# reconnu et le client reçoit un nouvel état complet
+EPOCH = os.urandom(4).hex()
+
+# Trame publiée sur le broker : id d'événement, clé de l'objet, trame (dict, en
+# lecture seule) et sa sérialisation
+Frame = namedtuple('Frame', 'event_id object_id data message')
+
+_MISSING = object()
+
+
+def diff(old, new):
+    """Patch qui transforme `old` en `new` : champs changés, None pour les champs retirés"""
+    patch = {}
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if previous == value:
+            continue
+        if isinstance(value, dict) and isinstance(previous, dict):
+            patch[key] = diff(previous, value)
+        else:
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
+
+
+def format_id(number):
+    return f'{EPOCH}-{number}'
+
+
+def parse_id(event_id):
+    """Numéro d'un id émis par ce processus, ou None"""
+    epoch, _, number = (event_id or '').strip().partition('-')
+    if epoch != EPOCH or not number.isdigit():
+        return None
+    return int(number)
+
+
+class EventLog:
+    """
+    Anneau des dernières trames de chaque objet, numérotées dans l'ordre de réception,
+    et anneau commun à tous les objets. Les anneaux des objets inactifs ou hors
+    ligne sont retirés et leur nombre est borné.
+    """
+
+    def __init__(self, size=REPLAY_SIZE, global_size=GLOBAL_REPLAY_SIZE,
+                 max_rings=MAX_RINGS, idle=RING_IDLE):
+        self.size = size
+        self.max_rings = max_rings
+        self.idle = idle
+        self._rings = OrderedDict()  # object_id -> (anneau, dernière trame à), du moins récent au plus récent
+        self._all = deque(maxlen=global_size)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def append(self, object_id, message):
+        """Enregistre une trame sérialisée ; renvoie son id d'événement"""
+        now = time.monotonic()
+        with self._lock:
+            number = next(self._counter)
+            entry = self._rings.pop(object_id, None)
+            ring = entry[0] if entry is not None else deque(maxlen=self.size)
+            ring.append((number, message))
+            self._rings[object_id] = (ring, now)
+            self._all.append((number, object_id, message))
+            while self._rings:
+                oldest, (_, last) = next(iter(self._rings.items()))
+                if len(self._rings) <= self.max_rings and now - last < self.idle:
+                    break
+                del self._rings[oldest]
+        return format_id(number)
+
+    def forget(self, object_id):
+        """Retire l'anneau d'un objet (passé hors ligne)"""
+        with self._lock:
+            self._rings.pop(object_id, None)
+
+    def last(self, object_id):
+        """(id, trame sérialisée) de la dernière trame de l'objet, ou None"""
+        with self._lock:
+            entry = self._rings.get(object_id)
+            if entry is None:
+                return None
+            number, message = entry[0][-1]
+        return format_id(number), message
+
+    def replay(self, event_id, object_id=None):
+        """
+        Reprise après `event_id`, pour un objet ou pour tous : (états, événements)
+        états: {object_id: trame} déjà reçue par le client à cet id
+        événements: [(id, object_id, trame), ...] manqués, dans l'ordre
+        None si l'id est inconnu. Pour un objet dont les trames manquées ont
+        déjà quitté l'anneau, seule la dernière est rejouée, sans état connu.
+        Le flux de tous les objets reprend de l'anneau commun, sans état connu :
+        la première trame rejouée de chaque objet est un état complet.
+        """
+        after = parse_id(event_id)
+        if after is None:
+            return None
+        if object_id is None:
+            return self._replay_all(after)
+        # Copie sous le verrou, décodage en dehors
+        with self._lock:
+            entry = self._rings.get(object_id)
+            entries = list(entry[0]) if entry is not None else []
+
+        states, events = {}, []
+        seen = [message for number, message in entries if number <= after]
+        missed = [(number, message) for number, message in entries if number > after]
+        if seen:
+            states[object_id] = json.loads(seen[-1])
+        elif len(entries) == self.size and missed:
+            missed = missed[-1:]  # trou : le client repart d'un état complet
+        events = [(format_id(number), object_id, json.loads(message)) for number, message in missed]
+        return states, events
+
+    def _replay_all(self, after):
+        missed = []
+        with self._lock:
+            for entry in reversed(self._all):
+                if entry[0] <= after:
+                    break
+                missed.append(entry)
+            gap = bool(self._all) and self._all[0][0] > after + 1
+        missed.reverse()
+        if gap and missed:
+            # Trames perdues : seule la dernière de chaque objet est rejouée
+            last = {key: (number, message) for number, key, message in missed}
+            missed = sorted((number, key, message) for key, (number, message) in last.items())
+        return {}, [(format_id(number), key, json.loads(message)) for number, key, message in missed]
+
+
+class LiveStream:
+    """
+    État d'une connexion /workout : ce que le client a reçu de chaque objet et
+    les trames en attente de son prochain rafraîchissement
+    interval: s minimum entre deux mises à jour d'un même objet (0 : aucune attente)
+    full: envoyer les trames complètes plutôt que des patchs
+    """
+
+    def __init__(self, interval=0.0, full=False):
+        self.interval = interval
+        self.full = full
+        self._sent = {}      # object_id -> dernier état envoyé
+        self._pending = {}   # object_id -> (id, trame) pas encore envoyée
+        self._next = {}      # object_id -> instant (monotone) du prochain envoi permis
+
+    def prime(self, object_id, frame):
+        """État que le client possède déjà (reprise), sans rien lui envoyer"""
+        self._sent[object_id] = frame
+
+    def known(self, object_id):
+        return object_id in self._sent
+
+    def render(self, object_id, frame, event_id=None):
+        """Événement SSE pour une trame, ou None si rien n'a changé"""
+        previous = self._sent.get(object_id)
+        self._sent[object_id] = frame
+        head = f"id: {event_id}\n" if event_id else ""
+        if previous is None:
+            return f"event: snapshot\n{head}data: {json.dumps(frame)}\n\n"
+        if self.full:
+            return f"{head}data: {json.dumps(frame)}\n\n"
+        patch = diff(previous, frame)
+        if not patch:
+            return None
+        # Le flux de tous les objets a besoin de l'objet pour appliquer le patch
+        if 'object_id' in frame:
+            patch['object_id'] = frame['object_id']
+        return f"{head}data: {json.dumps(patch)}\n\n"
+
+    def push(self, object_id, frame, event_id=None):
+        """Trame reçue : remplace celle en attente pour l'objet"""
+        self._pending[object_id] = (event_id, frame)
+
+    def flush(self, now):
+        """Événements des objets dont l'intervalle est écoulé"""
+        events = []
+        for object_id in [key for key in self._pending if self._next.get(key, 0) <= now]:
+            event_id, frame = self._pending.pop(object_id)
+            event = self.render(object_id, frame, event_id)
+            if event is not None:
+                events.append(event)
+                if self.interval:
+                    self._next[object_id] = now + self.interval
+        return events
+
+    def wait_time(self, now, default):
+        """Attente maximale avant le prochain envoi d'une trame en attente"""
+        if not self._pending:
+            return default
+        due = min(self._next.get(key, 0) for key in self._pending)
+        return max(0.0, min(default, due - now))
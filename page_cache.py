@@ -0,0 +1,100 @@
+from collections import OrderedDict
+import functools
+import hashlib
+import os
+import threading
+
+from flask import make_response, request, session
+
+
+# Cache des pages par utilisateur (/home, /dashboard) avec ETag.
+# Chaque utilisateur a un numéro de version, et un numéro global couvre les
+# données partagées (liste des nouveaux objets). L'ETag se calcule à partir de
+# ces compteurs, sans base de données : un rechargement identique renvoie 304
+# sans requête SQL ni rendu de template. Toute modification des données d'un
+# utilisateur incrémente sa version.
+
+MAX_PAGES = 2048  # pages gardées en mémoire (LRU)
+
+
+class PageCache:
+    """Pages rendues indexées par (route, utilisateur, variante)"""
+
+    def __init__(self, max_pages=MAX_PAGES):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._user_versions = {}
+        self._global_version = 0
+        # Les compteurs repartent à zéro au redémarrage : l'ETag porte donc un
+        # identifiant de processus pour ne jamais valider une page d'avant
+        self._epoch = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def etag(self, user_id, key):
+        version = self._user_versions.get(user_id, 0)
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=6).hexdigest()
+        return f'{self._epoch}-{digest}-{version}-{self._global_version}'
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._pages.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, etag, body):
+        with self._lock:
+            self._pages[key] = (etag, body)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Les données de cet utilisateur ont changé"""
+        with self._lock:
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+
+    def invalidate_all(self):
+        """Une donnée affichée à tous les utilisateurs a changé"""
+        with self._lock:
+            self._global_version += 1
+
+    def cached(self, variant=None):
+        """
+        Décorateur de vue : répond 304 si le client a déjà la version courante,
+        sinon sert la page en cache ou la rend puis la garde
+        variant: fonction renvoyant ce qui, en plus de l'URL, change la page
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = session.get('user_id')
+                if not user_id or request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = (request.endpoint, user_id, request.query_string,
+                       variant() if variant else None)
+                etag = self.etag(user_id, key)
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    response = make_response('', 304)
+                else:
+                    body = self.get(key, etag)
+                    if body is not None:
+                        self.hits += 1
+                        response = make_response(body)
+                    else:
+                        self.misses += 1
+                        response = make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        self.put(key, etag, response.get_data())
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
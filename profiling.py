@@ -0,0 +1,320 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+# Profilage des requêtes à la demande, pour voir où passe le temps d'une route
+# lente en production sans redéployer. Désactivé par défaut ; une fois activé
+# (DUMBBELL_PROFILING=1), une requête est profilée si elle porte l'en-tête
+# X-Profile (dont la valeur doit être DUMBBELL_PROFILE_TOKEN s'il est défini)
+# ou si elle est tirée au sort (DUMBBELL_PROFILE_RATE, ex. 0.01 pour 1 %).
+# Pour chaque requête profilée sont relevés : un profil cProfile ou des
+# échantillons de pile, les requêtes SQL passées par get_db (nombre et durée)
+# et les lectures / écritures des fichiers JSON du registre. Chaque profil est
+# écrit dans PROFILE_DIR, qui ne garde que les PROFILE_KEEP derniers.
+
+ENABLED = os.environ.get('DUMBBELL_PROFILING') == '1'
+SAMPLE_RATE = float(os.environ.get('DUMBBELL_PROFILE_RATE', '0'))  # part des requêtes profilées
+MODE = os.environ.get('DUMBBELL_PROFILE_MODE', 'cprofile')         # 'cprofile' ou 'sample'
+TOKEN = os.environ.get('DUMBBELL_PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('DUMBBELL_PROFILE_DIR', 'profiles')
+PROFILE_KEEP = 200         # profils gardés sur disque
+HEADER = 'X-Profile'
+SAMPLE_INTERVAL = 0.005    # s entre deux échantillons de pile (mode 'sample')
+TOP_FUNCTIONS = 30         # fonctions gardées dans le résumé cProfile
+TOP_STATEMENTS = 50        # requêtes SQL distinctes gardées dans le résumé
+
+MODES = ('cprofile', 'sample')
+
+# Profil de la requête en cours, par thread (pour les E/S du registre)
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'profile', None)
+
+
+def record_file_io(op, path, size, seconds):
+    """Observateur d'E/S du registre : relevé seulement pendant une requête profilée"""
+    profile = current()
+    if profile is not None:
+        profile.record_file(op, path, size, seconds)
+
+
+class _Sampler(threading.Thread):
+    """Relève la pile d'un thread toutes les `interval` s, en piles repliées"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class ProfiledCursor:
+    """Curseur SQLite qui ajoute ses exécutions et ses lectures au profil"""
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._sql = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        self._cursor.execute(sql, parameters)
+        self._sql = sql
+        self._profile.record_sql(sql, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_parameters)
+        self._sql = sql
+        self._profile.record_sql(sql, time.perf_counter() - started)
+        return self
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._profile.record_sql(self._sql, time.perf_counter() - started, executed=False)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ProfiledConnection:
+    """Connexion SQLite dont les requêtes sont mesurées ; le reste est délégué"""
+
+    def __init__(self, connection, profile):
+        self._connection = connection
+        self._profile = profile
+
+    def cursor(self):
+        return ProfiledCursor(self._connection.cursor(), self._profile)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        self._connection.commit()
+        self._profile.record_sql('COMMIT', time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class RequestProfile:
+    """Mesures d'une requête profilée"""
+
+    def __init__(self, trigger, mode):
+        self.started_at = time.time()
+        # Trié par date (rotation, index), unique entre workers
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        micros = int(self.started_at * 1e6) % 1000000
+        self.id = f"{stamp}.{micros:06d}-{uuid.uuid4().hex[:6]}"
+        self.trigger = trigger  # 'header' ou 'sample'
+        self.mode = mode
+        self.sql = {}           # requête -> [exécutions, durée]
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.files = []
+        self.status = None
+        self._connection = None
+        self._profiler = None
+        self._sampler = None
+        self._started = None
+        self.duration = None
+
+    def start(self):
+        _local.profile = self
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident())
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        _local.profile = None
+
+    def connection(self, connection):
+        """Connexion de get_db() enveloppée pour compter les requêtes SQL"""
+        if self._connection is None or self._connection._connection is not connection:
+            self._connection = ProfiledConnection(connection, self)
+        return self._connection
+
+    def record_sql(self, sql, seconds, executed=True):
+        entry = self.sql.setdefault(' '.join((sql or '?').split()), [0, 0.0])
+        if executed:
+            entry[0] += 1
+            self.sql_count += 1
+        entry[1] += seconds
+        self.sql_seconds += seconds
+
+    def record_file(self, op, path, size, seconds):
+        self.files.append({'op': op, 'path': path, 'bytes': size, 'seconds': seconds})
+
+    def _functions(self):
+        """Fonctions les plus coûteuses (temps cumulé) du profil cProfile"""
+        stats = pstats.Stats(self._profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+        return [{'function': f'{os.path.basename(filename)}:{line}({name})', 'calls': calls,
+                 'own_seconds': own, 'cumulative_seconds': cumulative}
+                for (filename, line, name), (_, calls, own, cumulative, _) in rows]
+
+    def summary(self):
+        return {'id': self.id, 'started_at': self.started_at, 'trigger': self.trigger,
+                'mode': self.mode, 'status': self.status, 'duration': self.duration,
+                'sql_count': self.sql_count, 'sql_seconds': self.sql_seconds,
+                'file_io': len(self.files)}
+
+    def report(self, **request_info):
+        statements = sorted(self.sql.items(), key=lambda item: item[1][1], reverse=True)
+        report = {**self.summary(), **request_info,
+                  'sql': [{'sql': sql, 'count': count, 'seconds': seconds}
+                          for sql, (count, seconds) in statements[:TOP_STATEMENTS]],
+                  'files': self.files}
+        if self._profiler is not None:
+            report['functions'] = self._functions()
+        if self._sampler is not None:
+            report['stacks'] = dict(self._sampler.stacks.most_common())
+        return report
+
+
+class RequestProfiler:
+    """Choisit les requêtes à profiler et range leurs profils dans un répertoire tournant"""
+
+    def __init__(self, enabled=ENABLED, sample_rate=SAMPLE_RATE, mode=MODE, token=TOKEN,
+                 directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        if mode not in MODES:
+            raise ValueError(f"Mode de profilage inconnu : {mode}")
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.token = token
+        self.directory = directory
+        self.keep = keep
+        # Un seul cProfile actif à la fois dans le processus
+        self._cprofile_lock = threading.Lock()
+        self._files_lock = threading.Lock()
+
+    def authorized(self, headers):
+        """L'en-tête X-Profile porte-t-il le jeton (n'importe quelle valeur sans jeton) ?"""
+        value = headers.get(HEADER)
+        return bool(value) and (self.token is None or value == self.token)
+
+    def can_view(self, headers):
+        """Accès à /debug/profiles : libre sans jeton, sinon avec l'en-tête X-Profile"""
+        return self.token is None or headers.get(HEADER) == self.token
+
+    def start(self, headers):
+        """Profil démarré si la requête est choisie, sinon None"""
+        if not self.enabled:
+            return None
+        if self.authorized(headers):
+            trigger = 'header'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        else:
+            return None
+        if self.mode == 'cprofile' and not self._cprofile_lock.acquire(blocking=False):
+            return None  # une autre requête est déjà profilée
+        profile = RequestProfile(trigger, self.mode)
+        profile.start()
+        return profile
+
+    def finish(self, profile, **request_info):
+        """Arrête le profil et l'écrit ; renvoie son id"""
+        try:
+            profile.stop()
+            report = profile.report(**request_info)
+            with self._files_lock:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f'{profile.id}.json')
+                with open(path, 'w') as file:
+                    json.dump(report, file)
+                if profile.mode == 'cprofile':
+                    profile._profiler.dump_stats(os.path.join(self.directory, f'{profile.id}.prof'))
+                self._rotate()
+        finally:
+            if profile.mode == 'cprofile':
+                self._cprofile_lock.release()
+        return profile.id
+
+    def _rotate(self):
+        names = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for profile_id in names[:max(0, len(names) - self.keep)]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def index(self):
+        """Résumés des profils gardés, du plus récent au plus ancien"""
+        try:
+            names = sorted((name for name in os.listdir(self.directory) if name.endswith('.json')),
+                           reverse=True)
+        except FileNotFoundError:
+            return []
+        profiles = []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    report = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                continue  # supprimé par la rotation ou en cours d'écriture
+            summary = {key: report.get(key) for key in
+                       ('id', 'started_at', 'method', 'path', 'endpoint', 'status', 'duration',
+                        'trigger', 'mode', 'sql_count', 'sql_seconds', 'file_io')}
+            if os.path.exists(os.path.join(self.directory, name[:-5] + '.prof')):
+                summary['prof'] = name[:-5] + '.prof'
+            profiles.append(summary)
+        return profiles
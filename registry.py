@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+
+
+# Registre des objets en mémoire, indexé par id.
+# - `new` : objets annoncés via /handle_info et pas encore associés (new_objects.json)
+# - `connected` : objets joignables par socket (connected_object.json)
+# Chaque modification est ajoutée à un journal ; le journal est périodiquement
+# compacté en réécrivant les deux fichiers JSON de façon atomique.
+
+NEW_OBJECTS_PATH = 'new_objects.json'
+CONNECTED_OBJECTS_PATH = 'connected_object.json'
+JOURNAL_PATH = 'registry_journal.jsonl'
+COMPACT_EVERY = 200  # entrées de journal avant compaction
+
+
+def _load_list(path):
+    try:
+        with open(path, 'r') as file:
+            objects = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    return objects if isinstance(objects, list) else []
+
+
+def _write_atomic(path, objects):
+    """Écrit un fichier temporaire puis le renomme : jamais de fichier à moitié écrit ; renvoie sa taille"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(objects, file)
+        size = file.tell()
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return size
+
+
+class DeviceRegistry:
+    """
+    Objets nouveaux et connectés, persistés par journal et compaction
+    on_io(op, path, size, seconds) est appelé après chaque écriture de fichier
+    (journal ou compaction), utilisé par le profilage des requêtes
+    """
+
+    def __init__(self, new_path=NEW_OBJECTS_PATH, connected_path=CONNECTED_OBJECTS_PATH,
+                 journal_path=JOURNAL_PATH, compact_every=COMPACT_EVERY, on_io=None):
+        self.paths = {'new': new_path, 'connected': connected_path}
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.on_io = on_io
+        self._lock = threading.RLock()
+        self._lists = {
+            name: {obj['id']: obj for obj in _load_list(path) if isinstance(obj, dict) and 'id' in obj}
+            for name, path in self.paths.items()
+        }
+        self._pending = self._replay()
+        self._journal = open(self.journal_path, 'a')
+
+    def _replay(self):
+        """Rejoue le journal laissé par une exécution précédente"""
+        count = 0
+        try:
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # dernière ligne tronquée par un arrêt brutal
+                    self._apply(entry)
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def _apply(self, entry):
+        objects = self._lists[entry['list']]
+        if entry['op'] == 'put':
+            objects[entry['object']['id']] = entry['object']
+        else:
+            objects.pop(entry['id'], None)
+
+    def _log(self, entry):
+        # Appelé avec le verrou : applique, journalise puis compacte si besoin
+        self._apply(entry)
+        line = json.dumps(entry) + '\n'
+        started = time.perf_counter()
+        self._journal.write(line)
+        self._journal.flush()
+        if self.on_io:
+            self.on_io('append', self.journal_path, len(line), time.perf_counter() - started)
+        self._pending += 1
+        if self._pending >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Réécrit les fichiers JSON atomiquement puis vide le journal"""
+        with self._lock:
+            for name, path in self.paths.items():
+                started = time.perf_counter()
+                size = _write_atomic(path, list(self._lists[name].values()))
+                if self.on_io:
+                    self.on_io('write', path, size, time.perf_counter() - started)
+            self._journal.close()
+            self._journal = open(self.journal_path, 'w')
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._pending:
+                self.compact()
+            self._journal.close()
+
+    # Lecture
+
+    def new_objects(self):
+        return list(self._lists['new'].values())
+
+    def get_new(self, object_id):
+        return self._lists['new'].get(object_id)
+
+    def get_connected(self, object_id):
+        return self._lists['connected'].get(object_id)
+
+    def __len__(self):
+        return len(self._lists['connected'])
+
+    def sizes(self):
+        """Nombre d'objets de chaque liste, ex. {'new': 3, 'connected': 10}"""
+        return {name: len(objects) for name, objects in self._lists.items()}
+
+    # Écriture
+
+    def register(self, data):
+        """Ajoute un objet annoncé ; False s'il était déjà connu"""
+        object_id = data['id']
+        with self._lock:
+            if object_id in self._lists['new']:
+                return False
+            self._log({'op': 'put', 'list': 'new', 'object': data})
+            if object_id in self._lists['connected']:
+                return False
+            self._log({'op': 'put', 'list': 'connected', 'object': data})
+            return True
+
+    def remove_new(self, object_id):
+        """Retire un objet de la liste des nouveaux (il vient d'être associé)"""
+        with self._lock:
+            if object_id in self._lists['new']:
+                self._log({'op': 'delete', 'list': 'new', 'id': object_id})
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+
+# Cumuls par utilisateur (jour et semaine ISO) mis à jour à chaque fin de série,
+# pour que /home et /dashboard ne lisent qu'une ligne par période au lieu de
+# parcourir l'historique brut.
+
+PERIODS = (
+    ('daily_rollups', 'day'),
+    ('weekly_rollups', 'week'),
+)
+
+
+def create_schema(connection):
+    """Crée les tables de cumuls ; la clé primaire (user_id, période) sert d'index"""
+    for table, period in PERIODS:
+        connection.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id TEXT NOT NULL,
+                {period} TEXT NOT NULL,
+                sets INTEGER NOT NULL DEFAULT 0,
+                reps INTEGER NOT NULL DEFAULT 0,
+                volume REAL NOT NULL DEFAULT 0,        -- somme de poids x répétitions
+                rep_duration REAL NOT NULL DEFAULT 0,  -- somme des durées de répétition (s)
+                PRIMARY KEY (user_id, {period})
+            )
+        ''')
+
+
+# Ajoute une série aux cumuls de tous les utilisateurs liés à l'objet
+UPSERT = {
+    table: f'''
+        INSERT INTO {table} (user_id, {period}, sets, reps, volume, rep_duration)
+        SELECT user_id, ?, 1, ?, ?, ? FROM users_objects WHERE object_id = ?
+        ON CONFLICT (user_id, {period}) DO UPDATE SET
+            sets = sets + excluded.sets,
+            reps = reps + excluded.reps,
+            volume = volume + excluded.volume,
+            rep_duration = rep_duration + excluded.rep_duration
+    '''
+    for table, period in PERIODS
+}
+
+
+def period_keys(ts):
+    """Clés jour (AAAA-MM-JJ) et semaine ISO (AAAA-Wss) d'un horodatage epoch"""
+    moment = datetime.fromtimestamp(ts)
+    year, week, _ = moment.isocalendar()
+    return moment.strftime('%Y-%m-%d'), f'{year}-W{week:02d}'
+
+
+def set_writes(summary):
+    """Écritures (sql, params) qui ajoutent une série terminée aux cumuls"""
+    reps = summary['reps']
+    if not reps:
+        return []
+    volume = (summary['weight'] or 0) * reps
+    rep_duration = (summary['avg_rep_duration'] or 0) * reps
+    day, week = period_keys(summary['ended_at'])
+    return [
+        (UPSERT['daily_rollups'], (day, reps, volume, rep_duration, summary['object_id'])),
+        (UPSERT['weekly_rollups'], (week, reps, volume, rep_duration, summary['object_id'])),
+    ]
+
+
+def _performance(row):
+    reps = row['reps']
+    return {
+        'repetitions': reps,
+        'avg_duration': round(row['rep_duration'] / reps, 1) if reps else 0,
+        'volume': row['volume'],
+        'sets': row['sets'],
+    }
+
+
+def weekly_performance(cursor, user_id, weeks=4):
+    """Performances des dernières semaines, de la plus ancienne (week_1) à la plus récente"""
+    cursor.execute('''
+        SELECT week, sets, reps, volume, rep_duration FROM weekly_rollups
+        WHERE user_id = ? ORDER BY week DESC LIMIT ?
+    ''', (user_id, weeks))
+    rows = list(reversed(cursor.fetchall()))
+    return {
+        f'week_{index}': dict(_performance(row), week=row['week'])
+        for index, row in enumerate(rows, start=1)
+    }
+
+
+def current_week_stats(cursor, user_id, now=None):
+    """Performances de la semaine en cours (zéros si aucune série)"""
+    _, week = period_keys(now or datetime.now().timestamp())
+    cursor.execute('''
+        SELECT sets, reps, volume, rep_duration FROM weekly_rollups
+        WHERE user_id = ? AND week = ?
+    ''', (user_id, week))
+    row = cursor.fetchone()
+    if not row:
+        return {'repetitions': 0, 'avg_duration': 0, 'volume': 0, 'sets': 0}
+    return _performance(row)
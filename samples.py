@@ -0,0 +1,139 @@
+from datetime import datetime
+import math
+import time
+
+
+# Historique des trames de capteurs : une ligne par échantillon dans `samples`.
+# Les nouvelles trames sont stockées en blocs compressés (chunks.py) ; la table
+# reste pour les bases antérieures, converties par la migration 4.
+
+SENSORS = ('left_dumbbell', 'right_dumbbell', 'left_elbow', 'right_elbow')
+AXES = ('x', 'y', 'z')
+
+# Colonnes des coordonnées : ld_x, ld_y, ..., re_z
+COORD_COLUMNS = tuple(
+    f"{''.join(part[0] for part in sensor.split('_'))}_{axis}"
+    for sensor in SENSORS for axis in AXES
+)
+
+# Champs d'une trame contrôlés avant stockage (absents ou null acceptés) et
+# bornes des valeurs numériques : au-delà, la valeur est fausse et déborderait
+# l'encodage entier des blocs (chunks.encode)
+TEXT_FIELDS = ('object_id', 'exercise')
+NUMERIC_RANGES = {
+    'weight': (0, 1000),
+    'current_set': (0, 1e6),
+    'current_rep': (0, 1e6),
+    'total_reps': (0, 1e9),
+    'temp': (-100, 200),
+    'battery': (0, 100),
+}
+MAX_COORDINATE = 100.0       # m, valeur absolue d'une coordonnée de capteur
+MIN_TIMESTAMP = 946684800    # 2000-01-01 : avant, l'horloge de l'objet n'est pas réglée
+MAX_CLOCK_AHEAD = 86400      # s d'avance tolérés sur le serveur (fuseaux horaires, dérive)
+
+COLUMNS = ('object_id', 'ts', 'exercise', 'weight', 'current_set', 'current_rep',
+           'total_reps') + COORD_COLUMNS + ('temp', 'battery')
+
+
+def create_schema(connection):
+    """Crée la table des échantillons et son index (object_id, ts)"""
+    coords = ',\n'.join(f'            {column} REAL' for column in COORD_COLUMNS)
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS samples (
+            id INTEGER PRIMARY KEY,
+            object_id TEXT NOT NULL,
+            ts REAL NOT NULL, -- horodatage epoch en secondes
+            exercise TEXT,
+            weight REAL,
+            current_set INTEGER,
+            current_rep INTEGER,
+            total_reps INTEGER,
+{coords},
+            temp REAL,
+            battery INTEGER
+        )
+    ''')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS idx_samples_object_ts ON samples (object_id, ts)'
+    )
+
+
+def parse_timestamp(value):
+    """Convertit l'horodatage d'une trame (epoch ou texte ISO) en secondes epoch"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _check_timestamp(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("Champ timestamp invalide : epoch ou texte ISO attendu")
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value).timestamp()
+        except (ValueError, OverflowError, OSError):
+            raise ValueError("Champ timestamp invalide : epoch ou texte ISO attendu")
+    if not (math.isfinite(value) and MIN_TIMESTAMP <= value <= time.time() + MAX_CLOCK_AHEAD):
+        raise ValueError("Champ timestamp invalide : date hors plage")
+
+
+def validate_frame(frame):
+    """Vérifie les types et les plages d'une trame avant stockage ; ValueError si un champ est invalide"""
+    for field in TEXT_FIELDS:
+        value = frame.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Champ {field} invalide : texte attendu")
+    for field, (low, high) in NUMERIC_RANGES.items():
+        value = frame.get(field)
+        if value is None:
+            continue
+        if not _is_number(value):
+            raise ValueError(f"Champ {field} invalide : nombre attendu")
+        if not low <= value <= high:
+            raise ValueError(f"Champ {field} invalide : hors de [{low:g}, {high:g}]")
+    if frame.get('timestamp') is not None:
+        _check_timestamp(frame['timestamp'])
+    sensors = frame.get('sensors')
+    if sensors is None:
+        return
+    if not isinstance(sensors, dict):
+        raise ValueError("Champ sensors invalide : objet attendu")
+    for sensor, position in sensors.items():
+        if not isinstance(position, dict):
+            raise ValueError(f"Capteur {sensor} invalide : objet attendu")
+        for axis in AXES:
+            value = position.get(axis)
+            if not _is_number(value) or abs(value) > MAX_COORDINATE:
+                raise ValueError(f"Capteur {sensor}.{axis} invalide : nombre fini attendu "
+                                 f"(|valeur| <= {MAX_COORDINATE:g})")
+
+
+def sample_row(object_id, frame):
+    """Aplatit une trame JSON en tuple dans l'ordre de COLUMNS"""
+    sensors = frame.get('sensors') or {}
+    coords = []
+    for sensor in SENSORS:
+        position = sensors.get(sensor) or {}
+        coords.extend(position.get(axis) for axis in AXES)
+    return (
+        object_id,
+        parse_timestamp(frame.get('timestamp')),
+        frame.get('exercise'),
+        frame.get('weight'),
+        frame.get('current_set'),
+        frame.get('current_rep'),
+        frame.get('total_reps'),
+        *coords,
+        frame.get('temp'),
+        frame.get('battery'),
+    )
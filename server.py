@@ -1,45 +1,158 @@
-from flask import Flask, render_template, request, redirect, url_for, session, g, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, session, g, jsonify, Response, send_from_directory
 import sqlite3
 import uuid
 import threading
 import time
-import socket
 import json
+import math
+import traceback
+import atexit
+import os
+from datetime import datetime
+
+from analytics import AnalyticsEngine
+import analytics
+from broker import Broker
+import chunks
+import database
+import export
+from db_writer import BatchWriter
+from device_client import DeviceConnectionPool, DeviceUnavailable
+import frame_codec
+import health
+import live_stream
+import metrics
+import profiling
+from page_cache import PageCache
+from registry import DeviceRegistry
+import rollups
+import samples
+import shared_frames
 
 
 # Liste des objets existants et nouveaux
 existing_objects = []
 
 FILE_PATH = 'new_objects.json'
+CONNECTED_PATH = 'connected_object.json'
 
-def load_new_objects():
-    try:
-        with open(FILE_PATH, 'r') as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-def save_new_objects(objects):
-    if not isinstance(objects, list):
-        raise ValueError("Les données à sauvegarder doivent être une liste.")
-    with open(FILE_PATH, 'w') as file:
-        json.dump(objects, file)
-
-# Chargement des objets connectés
-def load_connected_objects():
-    with open('connected_object.json', 'r') as file:
-        return json.load(file)
-
+# Registre des objets nouveaux et connectés, chargé une fois au démarrage
+# (ses écritures de fichiers sont relevées par les requêtes profilées)
+registry = DeviceRegistry(FILE_PATH, CONNECTED_PATH, on_io=profiling.record_file_io)
+atexit.register(registry.close)
 
-# Charger la liste des objets existants au démarrage
-new_objects_list = load_new_objects()
+# Connexions persistantes vers les objets pour leur envoyer des commandes
+device_pool = DeviceConnectionPool()
+atexit.register(device_pool.close)
 
 # Code Flask existant pour gérer les routes...
 
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Nécessaire pour gérer les sessions
-DATABASE = 'smart_dumbbell.db'
+DATABASE = database.DATABASE
+
+# Mettre le schéma à jour (migrations versionnées) avant d'ouvrir les connexions
+database.initialize_db(DATABASE)
+
+# Connexions SQLite réglées et réutilisées entre les requêtes
+db_pool = database.ConnectionPool(DATABASE)
+atexit.register(db_pool.close)
+
+# Métriques du serveur, exposées sur /metrics
+metrics_registry = metrics.Registry()
+REQUESTS = metrics_registry.counter(
+    'dumbbell_http_requests_total', "Requêtes HTTP traitées", ('method', 'endpoint', 'status'))
+REQUEST_LATENCY = metrics_registry.histogram(
+    'dumbbell_http_request_duration_seconds', "Durée de traitement des requêtes HTTP", ('endpoint',))
+INGEST_FRAMES = metrics_registry.counter(
+    'dumbbell_ingest_frames_total', "Trames de capteurs reçues par objet", ('object_id',))
+DB_BATCH_LATENCY = metrics_registry.histogram(
+    'dumbbell_db_batch_duration_seconds', "Durée de validation d'un lot d'écritures SQLite")
+DB_BATCH_ROWS = metrics_registry.counter(
+    'dumbbell_db_batch_rows_total', "Lignes écrites par l'écrivain en arrière-plan")
+
+# Profilage à la demande des requêtes (voir profiling.py), désactivé par défaut
+profiler = profiling.RequestProfiler()
+# Flux sans fin et pages du profilage lui-même : jamais profilés
+PROFILE_SKIP = {'workout', 'profile_index', 'profile_file', 'static'}
+
+# Écrivain en arrière-plan pour l'historique des échantillons
+def record_db_batch(seconds, rows):
+    DB_BATCH_LATENCY.observe(seconds)
+    DB_BATCH_ROWS.inc(amount=rows)
+
+sample_writer = BatchWriter(DATABASE, setup=database.configure, on_batch=record_db_batch)
+sample_writer.start()
+atexit.register(sample_writer.stop)
+
+# Historique des capteurs en blocs compressés, un bloc ouvert par objet
+chunk_buffer = chunks.ChunkBuffer()
+
+# Écrire les blocs ouverts avant l'arrêt de l'écrivain (atexit : ordre inverse)
+def flush_chunks():
+    for row in chunk_buffer.flush_all():
+        sample_writer.submit(chunks.INSERT_CHUNK, row)
+atexit.register(flush_chunks)
+
+# Pages /home et /dashboard en cache par utilisateur, servies avec ETag
+page_cache = PageCache()
+
+# La semaine en cours fait partie de la clé : les statistiques changent de période
+def current_week():
+    return rollups.period_keys(time.time())[1]
+
+# Invalide les pages des utilisateurs associés à un ou plusieurs objets
+def invalidate_object_owners(*object_ids):
+    object_ids = list(object_ids)
+    db = db_pool.acquire()
+    try:
+        owners = set()
+        for start in range(0, len(object_ids), 500):
+            batch = object_ids[start:start + 500]
+            sql = database.SELECT_OBJECTS_OWNERS.format(', '.join('?' for _ in batch))
+            owners.update(row['user_id'] for row in db.execute(sql, batch))
+    finally:
+        db_pool.release(db)
+    for user_id in owners:
+        page_cache.invalidate_user(user_id)
+
+# État des objets (en ligne, en séance, hors ligne, batterie faible)
+health_tracker = health.HealthTracker()
+HEALTH_TICK = health.TICK
+
+# Reprendre les objets encore actifs au dernier arrêt : ils expirent normalement
+_db = db_pool.acquire()
+try:
+    health_tracker.load(_db.execute(health.SELECT_ACTIVE).fetchall())
+finally:
+    db_pool.release(_db)
+
+# Tic de la roue ; changements d'état écrits à chaque tic, batterie et
+# température toutes les FLUSH_INTERVAL secondes, en un lot d'UPDATE
+def run_health_ticker():
+    last_flush = time.monotonic()
+    while True:
+        time.sleep(HEALTH_TICK)
+        # Une erreur ne doit pas arrêter le thread : les passages hors ligne cesseraient
+        try:
+            now = time.monotonic()
+            health_tracker.advance(now)
+            telemetry = now - last_flush >= health.FLUSH_INTERVAL
+            if telemetry:
+                last_flush = now
+            rows, changed = health_tracker.collect(include_telemetry=telemetry)
+            for row in rows:
+                sample_writer.submit(health.UPDATE_STATE, row)
+            if changed:
+                # Les pages /home des propriétaires affichent l'état
+                sample_writer.after_commit(lambda changed=changed: invalidate_object_owners(*changed))
+                offline = [object_id for object_id in changed if health_tracker.state(object_id) == health.OFFLINE]
+                if offline:
+                    forget_offline(offline)
+        except Exception as e:
+            print(f"Erreur lors du suivi de l'état des objets : {e}")
+            traceback.print_exc()
 
 # Fonction pour générer un identifiant aléatoire
 def generate_random_id():
@@ -48,16 +161,55 @@ def generate_random_id():
 # Fonction pour se connecter à la base de données
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par nom
+        g.db = db_pool.acquire()  # Connexion du pool, déjà réglée (row_factory, PRAGMA)
+    # Requête profilée : compter et chronométrer ses requêtes SQL
+    profile = g.get('profile')
+    if profile is not None:
+        return profile.connection(g.db)
     return g.db
 
-# Ferme la connexion à la base de données après chaque requête
+# Mesure de chaque requête, par route
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint)
+        REQUESTS.inc(request.method, endpoint, response.status_code)
+    return response
+
+# Profil des requêtes choisies (en-tête X-Profile ou tirage au sort)
+@app.before_request
+def start_profile():
+    if profiler.enabled and request.endpoint not in PROFILE_SKIP:
+        g.profile = profiler.start(request.headers)
+
+@app.after_request
+def record_profile_status(response):
+    profile = g.get('profile')
+    if profile is not None:
+        profile.status = response.status_code
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def finish_profile(exception):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish(profile, method=request.method, path=request.full_path.rstrip('?'),
+                        endpoint=request.endpoint,
+                        error=repr(exception) if exception is not None else None)
+
+# Rend la connexion au pool après chaque requête
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
 
 # Route pour la page d'accueil
 @app.route('/')
@@ -67,23 +219,18 @@ def index():
 
 @app.route('/use_object/<object_id>', methods=['POST'])
 def use_object(object_id):
-    connected_objects = load_connected_objects()
-
-    # Trouver l'objet correspondant dans le fichier JSON
-    target_object = next((obj for obj in connected_objects if obj['id'] == object_id), None)
+    # Trouver l'objet correspondant dans le registre
+    target_object = registry.get_connected(object_id)
     if target_object:
         try:
-            # Établir une connexion avec le socket
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((target_object['ip'], target_object['port']))
-                s.sendall(b"use")  # Envoyer la commande "use"
-                # Attendre la réponse
-                response = s.recv(1024).decode('utf-8')
-                if response == "ok":
-                    # Mettre à jour l'état de l'objet à "Using"
-                    print(response)
-                    return render_template('workout.html')
-        except (socket.error, Exception) as e:
+            # Envoyer la commande "use" sur une connexion du pool et attendre la réponse
+            ip = target_object.get('ip') or target_object.get('addr')
+            response = device_pool.command(ip, target_object['port'], "use")
+            if response == "ok":
+                # Mettre à jour l'état de l'objet à "Using"
+                print(response)
+                return render_template('workout.html')
+        except DeviceUnavailable as e:
             print(f"Erreur de connexion avec l'objet {target_object['name']}: {e}")
     
     return redirect(url_for('home'))
@@ -95,30 +242,314 @@ def delete_object(object_id):
     user_objects = [obj for obj in user_objects if obj['id'] != object_id]
     return redirect(url_for('home'))
 
-# Données fictives pour les performances d'exercice (juste pour simuler l'exercice en temps réel)
-workout_data = {}
+# Dernière trame de chaque objet, en mémoire partagée entre les processus du
+# serveur (plusieurs workers) ; les trames sans object_id sont rangées sous '*'
+live_frames = shared_frames.LiveFrameTable()
+atexit.register(live_frames.close)
+ANONYMOUS_OBJECT = '*'
+SHARED_POLL_INTERVAL = 0.05  # s entre deux lectures de la table partagée (autres workers présents)
+PEER_CHECK_INTERVAL = 1.0    # s entre deux recherches d'autres workers
+
+# Séquence de la dernière trame publiée par ce processus pour chaque objet :
+# ces trames arrivent aux flux par le broker, la table ne sert que pour les autres
+published_seqs = {}
+
+# Dernières trames reçues par ce processus, pour la reprise des flux (Last-Event-ID)
+event_log = live_stream.EventLog()
+
+# Objets passés hors ligne : libérer leur place dans la table partagée et leur anneau de reprise
+def forget_offline(object_ids):
+    for object_id in object_ids:
+        live_frames.release(object_id)
+        published_seqs.pop(object_id, None)
+        event_log.forget(object_id)
+
+# Démarré ici : le tic appelle forget_offline()
+threading.Thread(target=run_health_ticker, name='health-ticker', daemon=True).start()
+
+# Diffusion des trames aux flux /workout, par objet
+broker = Broker()
+SSE_KEEPALIVE = 15  # secondes sans trame avant d'envoyer un commentaire de maintien
+
+# Un seul lecteur de la table partagée par processus, et seulement quand
+# d'autres workers y écrivent et que des flux sont ouverts : leurs trames sont
+# publiées sur le broker local, comme celles de ce processus (sans id de reprise).
+# Seul un worker est pris en charge (registre, caches de pages, blocs en cours
+# et analyses sont propres à chaque processus) : plusieurs processus ne se
+# recouvrent que le temps d'un rechargement, d'où l'avertissement sinon.
+def poll_shared_frames():
+    sequences = None
+    peers_checked, peers = 0.0, 0
+    while True:
+        now = time.monotonic()
+        if now - peers_checked >= PEER_CHECK_INTERVAL:
+            previous, (peers_checked, peers) = peers, (now, live_frames.peers())
+            if peers and not previous:
+                print(f"Attention : {peers} autre(s) processus serveur sur la table partagée. "
+                      f"Un seul worker est pris en charge ; le registre, les caches et les "
+                      f"analyses ne sont pas partagés entre processus.")
+        if not peers or not broker.subscriber_count():
+            sequences = None
+            time.sleep(PEER_CHECK_INTERVAL)
+            continue
+        if sequences is None:
+            sequences = live_frames.sequences()
+        time.sleep(SHARED_POLL_INTERVAL)
+        sequences, remote = live_frames.changes(sequences)
+        for key, seq, frame in remote:
+            if published_seqs.get(key) != seq:
+                object_id = None if key == ANONYMOUS_OBJECT else key
+                broker.publish(object_id, live_stream.Frame(None, key, json.loads(frame), frame))
+
+threading.Thread(target=poll_shared_frames, name='shared-frames-poller', daemon=True).start()
+
+# Jauges lues au moment de l'export : rien à mettre à jour sur le chemin des trames
+def sse_queue_depths():
+    return {('*' if object_id is None else object_id): depths
+            for object_id, depths in broker.queue_depths().items()}
+
+metrics_registry.gauge(
+    'dumbbell_sse_subscribers', "Flux /workout ouverts par objet ('*' : tous les objets)",
+    ('object_id',), lambda: {key: len(depths) for key, depths in sse_queue_depths().items()})
+metrics_registry.gauge(
+    'dumbbell_sse_queued_messages', "Messages en attente dans les files des abonnés, par objet",
+    ('object_id',), lambda: {key: sum(depths) for key, depths in sse_queue_depths().items()})
+metrics_registry.gauge(
+    'dumbbell_sse_queue_depth_max', "File d'abonné la plus remplie, par objet",
+    ('object_id',), lambda: {key: max(depths) for key, depths in sse_queue_depths().items()})
+metrics_registry.gauge(
+    'dumbbell_registry_objects', "Objets du registre par liste", ('list',), registry.sizes)
+metrics_registry.gauge(
+    'dumbbell_devices', "Objets suivis par état", ('state',),
+    lambda: health_tracker.state_counts())
+metrics_registry.gauge(
+    'dumbbell_db_write_queue', "Écritures en attente de l'écrivain SQLite",
+    function=lambda: sample_writer.queue.qsize())
+metrics_registry.gauge(
+    'dumbbell_shared_frames_slots_used', "Emplacements occupés de la table partagée des trames",
+    function=lambda: live_frames.used())
+metrics_registry.counter(
+    'dumbbell_shared_frames_dropped_total', "Trames non publiées dans la table partagée (pleine ou trame trop grande)",
+    function=lambda: live_frames.dropped)
+metrics_registry.counter(
+    'dumbbell_shared_frames_reclaimed_total', "Emplacements inactifs repris pour un nouvel objet",
+    function=lambda: live_frames.reclaimed)
+metrics_registry.counter(
+    'dumbbell_db_writes_dropped_total', "Écritures rejetées (file de l'écrivain pleine)",
+    function=lambda: sample_writer.dropped)
+metrics_registry.counter(
+    'dumbbell_db_writes_failed_total', "Écritures refusées par SQLite, écartées de leur lot",
+    function=lambda: sample_writer.failed)
+
+# Analyse des répétitions côté serveur
+analytics_engine = AnalyticsEngine()
+ANALYTICS_SWEEP_INTERVAL = 5  # secondes entre deux recherches de séries inactives
+
+# Diffuse les événements d'analyse et enregistre les séries terminées
+def handle_analytics_events(events):
+    for kind, payload in events:
+        broker.publish(payload['object_id'], ('analytics', json.dumps({'type': kind, **payload})))
+        if kind == 'set':
+            sample_writer.submit(analytics.INSERT_SET_METRICS, analytics.set_row(payload))
+            # Mise à jour incrémentale des cumuls jour/semaine des utilisateurs
+            for sql, params in rollups.set_writes(payload):
+                sample_writer.submit(sql, params)
+            # Une fois les cumuls validés, les pages des propriétaires sont périmées
+            object_id = payload['object_id']
+            sample_writer.after_commit(lambda object_id=object_id: invalidate_object_owners(object_id))
+
+# Clôture les séries des objets qui n'envoient plus de trames
+def sweep_analytics():
+    while True:
+        time.sleep(ANALYTICS_SWEEP_INTERVAL)
+        # Une erreur ne doit pas arrêter le thread : les tours suivants clôturent les autres séries
+        try:
+            handle_analytics_events(analytics_engine.sweep(time.monotonic()))
+            for row in chunk_buffer.flush_idle():
+                sample_writer.submit(chunks.INSERT_CHUNK, row)
+        except Exception as e:
+            print(f"Erreur lors du balayage des séries inactives : {e}")
+            traceback.print_exc()
+
+threading.Thread(target=sweep_analytics, name='analytics-sweeper', daemon=True).start()
+
+# Applique une trame de capteurs reçue d'un objet
+def apply_frame(data):
+    # Sérialiser une seule fois, publier pour tous les workers puis pousser la
+    # trame aux abonnés de ce processus
+    object_id = data.get('object_id')
+    message = json.dumps(data)
+    key = object_id or ANONYMOUS_OBJECT
+    published_seqs[key] = live_frames.write(key, message)
+    event_id = event_log.append(key, message)
+    broker.publish(object_id, live_stream.Frame(event_id, key, data, message))
+
+    # Historiser l'échantillon : les blocs complets sont écrits sans attendre le disque
+    if object_id:
+        INGEST_FRAMES.inc(object_id)
+        health_tracker.observe(object_id, data)
+        for row in chunk_buffer.add(object_id, data):
+            sample_writer.submit(chunks.INSERT_CHUNK, row)
+        # La trame est déjà publiée et historisée : une erreur d'analyse ne doit
+        # ni faire échouer la requête ni laisser un lot à moitié appliqué
+        try:
+            events = analytics_engine.process(object_id, data)
+        except Exception as e:
+            print(f"Erreur d'analyse d'une trame de {object_id} : {e}")
+            traceback.print_exc()
+            events = []
+        handle_analytics_events(events)
+
+# Décode un corps binaire (application/x-dumbbell-frame) en liste de trames
+def read_binary_frames():
+    try:
+        fields = frame_codec.header_fields(request.headers)
+        return frame_codec.decode_frames(request.get_data(), fields)
+    except ValueError:
+        return None
 
 @app.route('/handle_use', methods=['POST'])
 def handle_use():
+    # Format binaire compact si annoncé, JSON sinon
+    if request.mimetype == frame_codec.CONTENT_TYPE:
+        frames = read_binary_frames()
+        if not frames:
+            return jsonify({"status": "error", "message": "Trame binaire invalide"}), 400
+        try:
+            for frame in frames:
+                samples.validate_frame(frame)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        for frame in frames:
+            apply_frame(frame)
+        return jsonify({"status": "success", "message": "Données reçues"}), 200
+
     data = request.get_json()  # Récupérer les données envoyées en JSON
     #print(data)
-    if not data:
+    if not data or not isinstance(data, dict):
         return jsonify({"status": "error", "message": "Données manquantes"}), 400
+    try:
+        samples.validate_frame(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    # Mettre à jour les données d'exercice en temps réel
-    workout_data.update(data)
+    apply_frame(data)
 
     return jsonify({"status": "success", "message": "Données reçues"}), 200
 
 
+@app.route('/handle_use_batch', methods=['POST'])
+def handle_use_batch():
+    if request.mimetype == frame_codec.CONTENT_TYPE:
+        # Trames binaires concaténées
+        frames = read_binary_frames()
+        if not frames:
+            return jsonify({"status": "error", "message": "Trame binaire invalide"}), 400
+        for index, frame in enumerate(frames):
+            try:
+                samples.validate_frame(frame)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": f"Trame {index} invalide : {e}"}), 400
+    else:
+        frames = request.get_json(silent=True)  # Liste de trames envoyées en un seul appel
+        if not isinstance(frames, list) or not frames:
+            return jsonify({"status": "error", "message": "Données manquantes"}), 400
+
+        # Valider tout le lot avant d'appliquer quoi que ce soit
+        for index, frame in enumerate(frames):
+            if not isinstance(frame, dict) or not frame:
+                return jsonify({"status": "error", "message": f"Trame {index} invalide"}), 400
+            try:
+                samples.validate_frame(frame)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": f"Trame {index} invalide : {e}"}), 400
+
+    # Appliquer les trames dans l'ordre d'envoi
+    for frame in frames:
+        apply_frame(frame)
+
+    return jsonify({"status": "success", "message": "Données reçues", "count": len(frames)}), 200
+
+
 @app.route('/workout')
 def workout():
+    # Sans object_id, le flux reçoit les trames de tous les objets
+    object_id = request.args.get('object_id')
+    # Fréquence de rafraîchissement du client (par seconde) : au-delà, les trames sont fusionnées
+    try:
+        rate = float(request.args.get('rate', 0))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Fréquence invalide"}), 400
+    if not math.isfinite(rate) or rate < 0:
+        return jsonify({"status": "error", "message": "Fréquence invalide"}), 400
+    interval = 1 / min(rate, live_stream.MAX_RATE) if rate else 0.0
+    # format=full : trames complètes plutôt que des patchs, pour les clients simples
+    full = request.args.get('format') == 'full'
+    # EventSource renvoie Last-Event-ID à la reconnexion ; last_event_id pour les autres clients
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
     def generate():
         """Générer le flux d'événements pour afficher les mises à jour des données"""
-        while True:
-            # Diffuser les données d'exercice en temps réel
-            yield f"data: {json.dumps(workout_data)}\n\n"
-            time.sleep(1)  # Attendre 1 seconde avant la prochaine mise à jour
+        subscription = broker.subscribe(object_id)
+        stream = live_stream.LiveStream(interval, full)
+        try:
+            current = live_frames.read(object_id) if object_id else None
+
+            # Reprise : rejouer les trames manquées depuis le dernier id reçu
+            replay = event_log.replay(last_event_id, object_id) if last_event_id else None
+            if replay is not None:
+                states, events = replay
+                for key, frame in states.items():
+                    stream.prime(key, frame)
+                for event_id, key, frame in events:
+                    event = stream.render(key, frame, event_id)
+                    if event is not None:
+                        yield event
+
+            # Sinon envoyer immédiatement le dernier état connu, quel que soit le worker qui l'a reçu
+            if object_id and not stream.known(object_id) and current:
+                local = event_log.last(object_id)
+                event_id = local[0] if local and local[1] == current[1] else None
+                yield stream.render(object_id, json.loads(current[1]), event_id)
+            elif not object_id and replay is None:
+                snapshot = live_frames.latest()
+                if snapshot:
+                    frame = json.loads(snapshot)
+                    yield stream.render(frame.get('object_id') or ANONYMOUS_OBJECT, frame)
+
+            last_sent = time.monotonic()
+            while True:
+                # Les trames (de ce processus ou relayées par poll_shared_frames)
+                # réveillent le flux ; sinon il dort jusqu'au maintien suivant
+                messages = []
+                now = time.monotonic()
+                timeout = stream.wait_time(now, max(0.0, SSE_KEEPALIVE - (now - last_sent)))
+                message = subscription.get(timeout=timeout)
+                while message is not None:
+                    messages.append(message)
+                    message = subscription.get(timeout=0)
+
+                sent = False
+                for message in messages:
+                    if isinstance(message, live_stream.Frame):
+                        stream.push(message.object_id, message.data, message.event_id)
+                    else:
+                        # Événement nommé (ex. analytics), ignoré par les clients qui n'écoutent que les trames
+                        event, payload = message
+                        sent = True
+                        yield f"event: {event}\ndata: {payload}\n\n"
+
+                for event in stream.flush(time.monotonic()):
+                    sent = True
+                    yield event
+
+                if sent:
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= SSE_KEEPALIVE:
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
 
     # Retourner la page HTML avec le flux SSE
     return Response(generate(), content_type='text/event-stream')
@@ -126,6 +557,7 @@ def workout():
 
 
 @app.route('/home')
+@page_cache.cached(variant=current_week)
 def home():
     # Vérifie si l'utilisateur est connecté via la session
     user_id = session.get('user_id')
@@ -135,33 +567,22 @@ def home():
     # Récupérer les informations de l'utilisateur
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+    cursor.execute(database.SELECT_USER_BY_ID, (user_id,))
     user = cursor.fetchone()
 
     if not user:
         return "Utilisateur non trouvé", 404  # Si l'utilisateur n'existe pas, afficher une erreur
 
-    # Données fictives pour les performances hebdomadaires
-    weekly_performance = {
-        'week_1': {'repetitions': 50, 'avg_duration': 15},
-        'week_2': {'repetitions': 60, 'avg_duration': 17},
-        'week_3': {'repetitions': 55, 'avg_duration': 16},
-        'week_4': {'repetitions': 70, 'avg_duration': 18}
-    }
+    # Performances hebdomadaires lues dans les cumuls (une lecture indexée)
+    weekly_performance = rollups.weekly_performance(cursor, user_id)
 
    # Récupérer les objets associés à l'utilisateur
-    cursor.execute('''
-        SELECT o.id, o.name, o.state 
-        FROM objects o 
-        JOIN users_objects uo ON o.id = uo.object_id 
-        WHERE uo.user_id = ?
-    ''', (user_id,))
+    cursor.execute(database.SELECT_USER_OBJECTS, (user_id,))
     user_objects = cursor.fetchall()
 
 
-    # Nouvelle liste d'objets (new_objects_list)
-    new_ob = []
-    new_ob.extend(new_objects_list)
+    # Nouvelle liste d'objets
+    new_ob = registry.new_objects()
     # Récupérer les messages de succès/erreur
     success_message = request.args.get('success')
     error_message = request.args.get('error')
@@ -185,8 +606,7 @@ def add_object():
     if entered_id != selected_object_id:
         return redirect(url_for('home', error="Les ID ne correspondent pas."))
 
-    new_objects_list = load_new_objects()
-    selected_object = next((obj for obj in new_objects_list if obj['id'] == selected_object_id), None)
+    selected_object = registry.get_new(selected_object_id)
 
     if not selected_object:
         return redirect(url_for('home', error="L'objet sélectionné n'existe pas."))
@@ -199,24 +619,27 @@ def add_object():
     cursor = db.cursor()
 
     # Vérifier si l'objet est déjà associé à l'utilisateur
-    cursor.execute('SELECT * FROM users_objects WHERE user_id = ? AND object_id = ?', (user_id, selected_object_id))
+    cursor.execute(database.SELECT_USER_OBJECT_LINK, (user_id, selected_object_id))
     if cursor.fetchone():
         return redirect(url_for('home', error="Cet objet est déjà enregistré pour cet utilisateur."))
 
     # Insérer l'objet dans `users_objects`
-    cursor.execute('INSERT INTO users_objects (user_id, object_id) VALUES (?, ?)', (user_id, selected_object_id))
+    cursor.execute(database.INSERT_USER_OBJECT, (user_id, selected_object_id))
 
     # Insérer l'objet dans `objects` si ce n'est pas encore le cas
-    cursor.execute('SELECT * FROM objects WHERE id = ?', (selected_object_id,))
+    cursor.execute(database.SELECT_OBJECT, (selected_object_id,))
     if not cursor.fetchone():
-        cursor.execute('INSERT INTO objects (id, name, state) VALUES (?, ?, ?)', 
-                       (selected_object_id, selected_object['name'], 'off'))
+        cursor.execute(database.INSERT_OBJECT, 
+                       (selected_object_id, selected_object['name'],
+                        health_tracker.state(selected_object_id) or health.OFFLINE))
 
     db.commit()
 
     # Mettre à jour la liste des nouveaux objets
-    new_objects_list = [obj for obj in new_objects_list if obj['id'] != selected_object_id]
-    save_new_objects(new_objects_list)
+    registry.remove_new(selected_object_id)
+
+    # La liste des nouveaux objets, affichée à tous, a changé
+    page_cache.invalidate_all()
 
     return redirect(url_for('home', success="L'objet a été ajouté avec succès."))
 
@@ -225,31 +648,21 @@ def add_object():
 @app.route('/handle_info', methods=['POST'])
 def handle_info():
     data = request.get_json()
-    if not data or 'id' not in data or 'name' not in data or 'weight' not in data:
+    if not isinstance(data, dict) or 'id' not in data or 'name' not in data or 'weight' not in data:
         return jsonify({"status": "error", "message": "Données manquantes"}), 400
+    # L'id sert de clé au registre, à la table partagée et à la base
+    if not isinstance(data['id'], str) or not data['id']:
+        return jsonify({"status": "error", "message": "Identifiant invalide : texte non vide attendu"}), 400
 
-    new_objects_list = load_new_objects()
-    
-    # Vérifie si l'objet existe déjà
-    if any(obj['id'] == data['id'] for obj in new_objects_list):
-        return jsonify({"status": "info", "message": "L'objet existe déjà."}), 200
-    
-    # Ajouter l'objet et sauvegarder
-    new_objects_list.append(data)
-    save_new_objects(new_objects_list)
-
-    # Charger les objets déjà connectés depuis connected_object.json
-    connected_objects = load_connected_objects()
+    # L'objet vient de s'annoncer : il est joignable
+    health_tracker.mark_online(data['id'])
 
-    # Vérifier si l'objet existe déjà dans connected_object.json
-    if any(obj['id'] == data['id'] for obj in connected_objects):
+    # Vérifie si l'objet existe déjà, sinon l'ajouter au registre
+    if not registry.register(data):
         return jsonify({"status": "info", "message": "L'objet existe déjà."}), 200
 
-    # Ajouter l'objet et sauvegarder dans connected_object.json
-    connected_objects.append(data)
-    with open('connected_object.json', 'w') as file:
-        json.dump(connected_objects, file)
-
+    # Nouvel objet visible par tous les utilisateurs
+    page_cache.invalidate_all()
 
     return jsonify({"status": "success", "message": "Objet ajouté avec succès."}), 200
 
@@ -294,7 +707,7 @@ def login():
         # Vérification dans la base de données
         db = get_db()
         cursor = db.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ? AND password = ?', (username, password))
+        cursor.execute(database.SELECT_USER_LOGIN, (username, password))
         user = cursor.fetchone()
 
         if user:
@@ -307,6 +720,7 @@ def login():
     return render_template('login.html')
 
 @app.route('/dashboard')
+@page_cache.cached(variant=current_week)
 def dashboard():
     user_id = session.get('user_id')  # Récupération de l'ID utilisateur de la session
     if not user_id:
@@ -314,26 +728,120 @@ def dashboard():
 
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+    cursor.execute(database.SELECT_USER_BY_ID, (user_id,))
     user = cursor.fetchone()  # Récupère l'utilisateur à partir de son ID
 
     if not user:
         return "Utilisateur non trouvé", 404  # Si l'utilisateur n'est pas trouvé, afficher une erreur
 
-    # Données fictives pour les performances
-    stats = {
-        'repetitions': 50,
-        'avg_duration': 15,
-    }
+    # Performances de la semaine en cours, lues dans les cumuls
+    stats = rollups.current_week_stats(cursor, user_id)
 
     # Récupérer les objets connectés de l'utilisateur
-    cursor.execute('SELECT * FROM objects WHERE user_id = ?', (user_id,))
+    cursor.execute(database.SELECT_USER_OBJECTS, (user_id,))
     objects = cursor.fetchall()  # Liste des objets de l'utilisateur
 
-    new_ob = new_ob + new_objects_list
+    new_ob = registry.new_objects()
 
     # Passer les informations au template
-    return render_template('dashboard.html', user=user, new_ob=new_ob, objects=objects)
+    return render_template('dashboard.html', user=user, new_ob=new_ob, objects=objects, stats=stats)
+
+
+# Accès de l'utilisateur connecté à l'historique d'un objet : réponse d'erreur, ou None s'il le possède
+def check_object_access(object_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"status": "error", "message": "Connexion requise"}), 401
+    if get_db().execute(database.SELECT_USER_OBJECT_LINK, (user_id, object_id)).fetchone() is None:
+        return jsonify({"status": "error", "message": "Objet introuvable"}), 404
+    return None
+
+# Séries d'un objet sur une période, réduites à la résolution du graphique
+@app.route('/api/objects/<object_id>/samples')
+def object_samples(object_id):
+    denied = check_object_access(object_id)
+    if denied:
+        return denied
+    try:
+        start = parse_time_arg('from', 0.0)
+        end = parse_time_arg('to', time.time())
+        points = int(request.args.get('points', chunks.DEFAULT_POINTS))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    field = request.args.get('field', chunks.DEFAULT_FIELD)
+    if field not in chunks.FIELDS:
+        return jsonify({"status": "error", "message": f"Champ inconnu : {field}"}), 400
+    points = max(3, min(points, chunks.MAX_POINTS))
+
+    result = chunks.query_range(get_db(), object_id, start, end, points, field,
+                                pending=chunk_buffer.pending(object_id))
+    return jsonify({"object_id": object_id, "from": start, "to": end, **result})
+
+# Export en flux de l'historique d'un objet de l'utilisateur connecté, ou de tous ses objets
+@app.route('/api/export')
+def export_history():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        return jsonify({"status": "error", "message": f"Format inconnu : {export_format}"}), 400
+    try:
+        start = parse_time_arg('from', 0.0)
+        end = parse_time_arg('to', float('inf'))
+        cursor = request.args.get('cursor')
+        if cursor:
+            export.decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    object_id = request.args.get('object_id')
+    if object_id:
+        denied = check_object_access(object_id)
+        if denied:
+            return denied
+        object_ids = [object_id]
+    else:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({"status": "error", "message": "Connexion requise"}), 401
+        object_ids = [row['id'] for row in get_db().execute(database.SELECT_USER_OBJECTS, (user_id,))]
+
+    # Le générateur emprunte ses propres connexions : il s'exécute après la requête
+    records = export.iter_chunk_records(db_pool, object_ids, start, end, cursor)
+    filename = f"export-{object_id or 'user'}.{export_format}"
+    return Response(export.STREAMS[export_format](records),
+                    content_type=export.FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Paramètre de date : epoch en secondes ou texte ISO 8601
+def parse_time_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Paramètre '{name}' invalide : {value}")
+
+# Index des profils enregistrés (404 tant que le profilage est désactivé)
+@app.route('/debug/profiles')
+def profile_index():
+    if not profiler.enabled or not profiler.can_view(request.headers):
+        return jsonify({"status": "error", "message": "Profilage indisponible"}), 404
+    return jsonify({"profiles": profiler.index()})
+
+@app.route('/debug/profiles/<name>')
+def profile_file(name):
+    if not profiler.enabled or not profiler.can_view(request.headers):
+        return jsonify({"status": "error", "message": "Profilage indisponible"}), 404
+    return send_from_directory(os.path.abspath(profiler.directory), name)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Format texte Prometheus
+    return Response(metrics_registry.render(), content_type=metrics.Registry.CONTENT_TYPE)
 
 
 
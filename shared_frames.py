@@ -0,0 +1,384 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus, verrous de threads
+    fcntl = None
+
+
+# Table en mémoire partagée de la dernière trame de chaque objet.
+# Tous les processus du serveur (workers gunicorn, etc.) s'attachent au même
+# segment : une trame reçue par un worker est visible par les flux /workout de
+# tous les autres, sans service externe. Le serveur ne prend en charge qu'un
+# worker (voir README) : plusieurs processus ne se recouvrent que le temps d'un
+# rechargement.
+#
+# Le segment contient un en-tête puis SLOTS emplacements de taille fixe, placés
+# par hachage de l'id de l'objet (sondage linéaire). Chaque emplacement est
+# protégé par un seqlock : l'écrivain rend le compteur impair, écrit, puis le
+# rend pair ; un lecteur relit le compteur après sa copie et recommence s'il a
+# changé ou s'il était impair. Les écrivains d'un même emplacement s'excluent
+# par un verrou de fichier (fcntl.lockf) sur l'octet de l'emplacement.
+#
+# Le segment survit aux redémarrages : les emplacements sont libérés quand un
+# objet passe hors ligne (release()) et, table pleine, l'emplacement écrit il
+# y a le plus longtemps (au-delà de RECLAIM_AGE) est repris. Un emplacement
+# libéré reste marqué (TOMBSTONE) pour ne pas couper les chaînes de sondage.
+#
+# Chaque processus inscrit son pid dans l'en-tête : peers() indique s'il y a
+# d'autres workers, donc s'il faut lire la table pour leurs trames.
+
+SHM_NAME = os.environ.get('DUMBBELL_SHM_NAME', 'dumbbell_live_frames')
+SLOTS = 4096              # objets suivis simultanément
+SLOT_SIZE = 1024          # octets par emplacement, en-tête compris
+MAX_READ_ATTEMPTS = 100   # relectures d'un emplacement en cours d'écriture
+RECLAIM_AGE = 300         # s sans trame avant qu'un emplacement puisse être repris
+CLAIM_RETRY = 5.0         # s avant de retenter d'attribuer un emplacement (table pleine)
+ABSENT_RETRY = 1.0        # s avant de rechercher à nouveau un objet absent de la table
+MAX_MISSES = 10000        # échecs mémorisés avant de purger les plus anciens
+
+MAGIC = b'DBLIVE03'
+HEADER = struct.Struct('<8sIIQ')  # magic, slots, slot_size, dernier emplacement écrit + 1
+LAST_OFFSET = 16  # position du dernier champ de HEADER
+PEER_SLOTS = 64   # pids des processus attachés, après HEADER
+PEER = struct.Struct('<I')
+DATA_OFFSET = HEADER.size + PEER_SLOTS * PEER.size
+SLOT_HEADER = struct.Struct('<QId64s')  # séquence, longueur, date d'écriture (epoch), id de l'objet
+LENGTH_OFFSET = 8
+WRITTEN_OFFSET = 12
+KEY_OFFSET = 20
+MAX_ID = 64
+MAX_PAYLOAD = SLOT_SIZE - SLOT_HEADER.size
+TOMBSTONE = b'\xff'  # emplacement libéré (0xff n'apparaît jamais en UTF-8)
+
+
+class LiveFrameTable:
+    """Dernière trame (JSON déjà sérialisé) de chaque objet, partagée entre processus"""
+
+    def __init__(self, name=SHM_NAME, slots=SLOTS, slot_size=SLOT_SIZE, reclaim_age=RECLAIM_AGE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.reclaim_age = reclaim_age
+        size = DATA_OFFSET + slots * slot_size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.created = True
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self.created = False
+        # Le segment survit au processus qui l'a créé : les autres workers l'utilisent
+        resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        self._buf = self._shm.buf
+        if self.created:
+            HEADER.pack_into(self._buf, 0, MAGIC, slots, slot_size, 0)
+        else:
+            magic, stored_slots, stored_size, _ = HEADER.unpack_from(self._buf, 0)
+            if magic != MAGIC or (stored_slots, stored_size) != (slots, slot_size):
+                raise ValueError(f"Segment {name} incompatible (format {magic!r}, slots={stored_slots}, "
+                                 f"slot_size={stored_size}) : arrêter les workers et supprimer /dev/shm/{name}")
+
+        # Vues numpy des compteurs de séquence et des dates d'écriture de tous les emplacements
+        self._seqs = np.ndarray((slots,), dtype='<u8', buffer=self._buf,
+                                offset=DATA_OFFSET, strides=(slot_size,))
+        self._written = np.ndarray((slots,), dtype='<f8', buffer=self._buf,
+                                   offset=DATA_OFFSET + WRITTEN_OFFSET, strides=(slot_size,))
+        self._indexes = {}      # cache local object_id -> emplacement
+        self._unclaimable = {}  # object_id -> instant (monotone) de la prochaine tentative d'attribution
+        self._absent = {}       # object_id -> instant (monotone) de la prochaine recherche
+        self.dropped = 0        # trames de ce processus non publiées (table pleine, trame trop grande)
+        self.reclaimed = 0      # emplacements repris par ce processus
+        # Réentrant : l'attribution (octet 0) libère des emplacements sous son propre verrou
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        if fcntl is not None:
+            self._lock_file = open(os.path.join(tempfile.gettempdir(), f'{name}.lock'), 'a+b')
+        self.pid = os.getpid()
+        self._peer_index = self._register_peer()
+
+    # Verrous : octet 0 pour l'attribution des emplacements, octet i + 1 pour l'emplacement i
+
+    def _lock(self, index):
+        self._thread_lock.acquire()
+        if self._lock_file is not None:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, index + 1)
+
+    def _unlock(self, index):
+        if self._lock_file is not None:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, index + 1)
+        self._thread_lock.release()
+
+    def _offset(self, index):
+        return DATA_OFFSET + index * self.slot_size
+
+    # Processus attachés
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _pids(self):
+        return [PEER.unpack_from(self._buf, HEADER.size + i * PEER.size)[0] for i in range(PEER_SLOTS)]
+
+    def _register_peer(self):
+        """Inscrit ce processus à la place d'un pid libre ou d'un processus disparu"""
+        if fcntl is None:
+            return None
+        self._lock(-1)
+        try:
+            for index, pid in enumerate(self._pids()):
+                if pid == 0 or pid == self.pid or not self._alive(pid):
+                    PEER.pack_into(self._buf, HEADER.size + index * PEER.size, self.pid)
+                    return index
+            return None
+        finally:
+            self._unlock(-1)
+
+    def peers(self):
+        """Nombre d'autres processus vivants attachés au segment"""
+        if fcntl is None:
+            return 0  # Windows : un seul processus
+        return sum(1 for pid in self._pids() if pid and pid != self.pid and self._alive(pid))
+
+    def _key_at(self, index):
+        key = bytes(self._buf[self._offset(index) + KEY_OFFSET:self._offset(index) + KEY_OFFSET + MAX_ID])
+        return key.rstrip(b'\0')
+
+    def _set_key(self, index, key):
+        start = self._offset(index) + KEY_OFFSET
+        self._buf[start:start + MAX_ID] = key.ljust(MAX_ID, b'\0')
+
+    def _probe(self, key):
+        """(emplacement de la clé, ou premier emplacement libre rencontré, trouvée ?)"""
+        start = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') % self.slots
+        free = None
+        for probe in range(self.slots):
+            index = (start + probe) % self.slots
+            stored = self._key_at(index)
+            if stored == key:
+                return index, True
+            if stored == TOMBSTONE:
+                if free is None:
+                    free = index  # réutilisable, mais la clé peut être plus loin
+                continue
+            if not stored:
+                return (free if free is not None else index), False
+        return free, False
+
+    def _free(self, index):
+        """Libère un emplacement (appelé avec le verrou d'attribution)"""
+        self._lock(index)
+        try:
+            seq = int(self._seqs[index])
+            self._seqs[index] = seq + 1
+            struct.pack_into('<Id', self._buf, self._offset(index) + LENGTH_OFFSET, 0, 0.0)
+            self._set_key(index, TOMBSTONE)
+            self._seqs[index] = seq + 2
+        finally:
+            self._unlock(index)
+
+    def _reclaim_stalest(self):
+        """Libère l'emplacement écrit il y a le plus longtemps, s'il est assez ancien"""
+        written = self._written.copy()
+        live = written > 0
+        if not live.any():
+            return None
+        index = int(np.argmin(np.where(live, written, np.inf)))
+        if written[index] > time.time() - self.reclaim_age:
+            return None  # tous les objets sont actifs : la table est vraiment pleine
+        self._free(index)
+        self.reclaimed += 1
+        return index
+
+    def _find(self, key, claim=False):
+        """Emplacement de l'objet ; avec `claim`, l'attribue s'il n'en a pas"""
+        index, found = self._probe(key)
+        if found or not claim:
+            return index if found else None
+        # Attribution sous verrou, en refaisant le sondage : un autre processus
+        # a pu attribuer un emplacement à cette clé entre-temps
+        self._lock(-1)
+        try:
+            index, found = self._probe(key)
+            if found:
+                return index
+            if index is None:
+                self._reclaim_stalest()
+                index, found = self._probe(key)
+                if index is None:
+                    return None
+            struct.pack_into('<d', self._buf, self._offset(index) + WRITTEN_OFFSET, time.time())
+            self._set_key(index, key)
+            return index
+        finally:
+            self._unlock(-1)
+
+    @staticmethod
+    def _remember(misses, object_id, delay):
+        now = time.monotonic()
+        if len(misses) >= MAX_MISSES:
+            for stale in [key for key, retry_at in misses.items() if retry_at <= now]:
+                del misses[stale]
+            if len(misses) >= MAX_MISSES:
+                misses.clear()
+        misses[object_id] = now + delay
+
+    def _index(self, object_id, claim=False):
+        index = self._indexes.get(object_id)
+        if index is not None:
+            return index
+        key = object_id.encode('utf-8')
+        if not key or len(key) > MAX_ID or key == TOMBSTONE:
+            return None
+        # Échec récent : ne pas reparcourir toute la table à chaque trame
+        misses = self._unclaimable if claim else self._absent
+        retry_at = misses.get(object_id)
+        if retry_at is not None and time.monotonic() < retry_at:
+            return None
+        index = self._find(key, claim)
+        if index is None:
+            self._remember(misses, object_id, CLAIM_RETRY if claim else ABSENT_RETRY)
+            return None
+        misses.pop(object_id, None)
+        self._absent.pop(object_id, None)
+        self._indexes[object_id] = index
+        return index
+
+    def write(self, object_id, payload):
+        """Publie la dernière trame d'un objet ; renvoie sa séquence, ou None si
+        la trame ou l'id ne tiennent pas dans la table (comptée dans `dropped`)"""
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        key = object_id.encode('utf-8')
+        if len(data) > MAX_PAYLOAD:
+            self.dropped += 1
+            return None
+        for _ in range(2):
+            index = self._index(object_id, claim=True)
+            if index is None:
+                break
+            offset = self._offset(index)
+            self._lock(index)
+            try:
+                # L'emplacement a pu être libéré et repris par un autre processus
+                if self._key_at(index) != key:
+                    self._indexes.pop(object_id, None)
+                    continue
+                seq = int(self._seqs[index])
+                self._seqs[index] = seq + 1  # impair : écriture en cours
+                struct.pack_into('<Id', self._buf, offset + LENGTH_OFFSET, len(data), time.time())
+                start = offset + SLOT_HEADER.size
+                self._buf[start:start + len(data)] = data
+                self._seqs[index] = seq + 2
+                struct.pack_into('<Q', self._buf, LAST_OFFSET, index + 1)
+            finally:
+                self._unlock(index)
+            return seq + 2
+        self.dropped += 1
+        return None
+
+    def release(self, object_id):
+        """Libère l'emplacement d'un objet (passé hors ligne) ; True s'il en avait un"""
+        key = object_id.encode('utf-8')
+        if not key or len(key) > MAX_ID:
+            return False
+        self._indexes.pop(object_id, None)
+        self._lock(-1)
+        try:
+            index, found = self._probe(key)
+            if found:
+                self._free(index)
+            return found
+        finally:
+            self._unlock(-1)
+
+    def _read_slot(self, index, key=None):
+        """(séquence, trame) cohérents d'un emplacement, ou None s'il est vide
+        (ou, avec `key`, s'il appartient à un autre objet)"""
+        offset = self._offset(index)
+        for _ in range(MAX_READ_ATTEMPTS):
+            seq = int(self._seqs[index])
+            if seq & 1:
+                time.sleep(0)  # écriture en cours : laisser l'écrivain finir
+                continue
+            length = struct.unpack_from('<I', self._buf, offset + LENGTH_OFFSET)[0]
+            start = offset + SLOT_HEADER.size
+            data = bytes(self._buf[start:start + min(length, MAX_PAYLOAD)])
+            stored = self._key_at(index) if key is not None else None
+            if int(self._seqs[index]) == seq:
+                if not seq or not data or (key is not None and stored != key):
+                    return None
+                return seq, data.decode('utf-8')
+        return None
+
+    def read(self, object_id):
+        """(séquence, trame) de l'objet, ou None ; la séquence change à chaque trame"""
+        index = self._index(object_id)
+        if index is None:
+            return None
+        result = self._read_slot(index, object_id.encode('utf-8'))
+        if result is None and self._key_at(index) != object_id.encode('utf-8'):
+            self._indexes.pop(object_id, None)  # emplacement repris : chercher à nouveau
+        return result
+
+    def latest(self):
+        """Trame écrite en dernier, tous objets confondus"""
+        last = struct.unpack_from('<Q', self._buf, LAST_OFFSET)[0]
+        if not last:
+            return None
+        result = self._read_slot(last - 1)
+        return result[1] if result else None
+
+    def sequences(self):
+        """Copie des compteurs de tous les emplacements, à passer à changes()"""
+        return self._seqs.copy()
+
+    def changes(self, previous):
+        """Trames publiées depuis `previous` : (nouveaux compteurs, [(object_id, séquence, trame), ...])"""
+        current = self._seqs.copy()
+        frames = []
+        for index in np.flatnonzero(current != previous).tolist():
+            key = self._key_at(index)
+            if not key or key == TOMBSTONE:
+                continue
+            result = self._read_slot(index, key)
+            if result is not None:
+                frames.append((key.decode('utf-8'), *result))
+        return current, frames
+
+    def used(self):
+        """Emplacements occupés par un objet"""
+        return int(np.count_nonzero(self._written.copy() > 0))
+
+    def close(self):
+        if self._buf is None:
+            return  # déjà fermée (atexit après une fermeture explicite)
+        if self._peer_index is not None:
+            offset = HEADER.size + self._peer_index * PEER.size
+            if PEER.unpack_from(self._buf, offset)[0] == self.pid:
+                PEER.pack_into(self._buf, offset, 0)
+        self._seqs = None
+        self._written = None
+        self._buf = None
+        self._shm.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def unlink(self):
+        """Supprime le segment (à l'arrêt du dernier processus)"""
+        # unlink() le retire du suivi des ressources : l'y remettre d'abord
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
@@ -0,0 +1,272 @@
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+import requests
+
+import frame_codec
+
+# Durable on-disk ring buffer for outgoing workout frames
+#
+# The sampling loop appends frames to a fixed-size memory-mapped file and
+# returns immediately; a sender thread drains the file to the server in
+# batches, retrying with exponential backoff while the server is unreachable.
+# A batch the server refuses (4xx, or errors MAX_ATTEMPTS times in a row) is
+# resent frame by frame, so only the frames it keeps refusing are dropped.
+# Frames survive server restarts, network outages and device restarts; when
+# the file is full the oldest frames are overwritten, so memory and disk use
+# never grow.
+#
+# File layout: a header (magic, geometry, head and tail sequence numbers)
+# followed by `capacity` slots of `slot_size` bytes. Each slot holds its
+# sequence number, payload length and CRC32, then the JSON-encoded frame.
+
+HEADER = struct.Struct('<8sIIQQQ')  # magic, slot_size, capacity, head, tail, dropped
+SLOT_HEADER = struct.Struct('<QII')  # sequence, length, crc32
+MAGIC = b'DBSPOOL1'
+
+SPOOL_PATH = 'device_spool.bin'
+CAPACITY = 4096          # frames kept on disk (about 3.5 minutes at 20 frames/s)
+SLOT_SIZE = 1024         # bytes per frame slot, header included
+BACKOFF_INITIAL = 0.5    # seconds before the first retry
+BACKOFF_MAX = 30.0       # ceiling of the retry delay
+REQUEST_TIMEOUT = 5.0    # seconds before a post is considered failed
+MAX_ATTEMPTS = 3         # server errors on the same batch before it is resent frame by frame
+
+# Outcomes of a post
+SENT, REJECTED, FAILED, UNREACHABLE = 'sent', 'rejected', 'failed', 'unreachable'
+
+
+class FrameTooLarge(ValueError):
+    """Raised when an encoded frame does not fit in a slot"""
+
+
+class RingSpool:
+    """Fixed-size ring of frames in a memory-mapped file, shared by threads of one process"""
+
+    def __init__(self, path=SPOOL_PATH, capacity=CAPACITY, slot_size=SLOT_SIZE):
+        self.path = path
+        self._lock = threading.Lock()
+        size = HEADER.size + capacity * slot_size
+        fresh = not os.path.exists(path) or os.path.getsize(path) != size
+        self._file = open(path, 'r+b' if not fresh else 'w+b')
+        if fresh:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        magic, stored_slot, stored_capacity, head, tail, dropped = HEADER.unpack_from(self._map, 0)
+        if fresh or magic != MAGIC or (stored_slot, stored_capacity) != (slot_size, capacity):
+            head = tail = dropped = 0
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.head = head        # sequence number of the oldest unsent frame
+        self.tail = tail        # sequence number of the next frame to append
+        self.dropped = dropped  # frames overwritten before they could be sent
+        self._recover()
+        self._write_header()
+
+    def _recover(self):
+        """Stop the backlog at the first slot a crash left half-written"""
+        if self.tail - self.head > self.capacity:
+            self.head = self.tail - self.capacity
+        for sequence in range(self.head, self.tail):
+            if self._read_slot(sequence) is None:
+                self.tail = sequence
+                break
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, MAGIC, self.slot_size, self.capacity,
+                         self.head, self.tail, self.dropped)
+
+    def _offset(self, sequence):
+        return HEADER.size + (sequence % self.capacity) * self.slot_size
+
+    def _read_slot(self, sequence):
+        offset = self._offset(sequence)
+        stored, length, crc = SLOT_HEADER.unpack_from(self._map, offset)
+        if stored != sequence or length > self.slot_size - SLOT_HEADER.size:
+            return None
+        start = offset + SLOT_HEADER.size
+        payload = self._map[start:start + length]
+        if zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def append(self, payload):
+        """Store one encoded frame, overwriting the oldest one if the ring is full"""
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            raise FrameTooLarge(f"Frame of {len(payload)} bytes exceeds the {self.slot_size} byte slot")
+        with self._lock:
+            if self.tail - self.head >= self.capacity:
+                self.head += 1
+                self.dropped += 1
+            offset = self._offset(self.tail)
+            SLOT_HEADER.pack_into(self._map, offset, self.tail, len(payload), zlib.crc32(payload))
+            self._map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+            # The payload is in place before the tail moves past it
+            self.tail += 1
+            self._write_header()
+
+    def peek(self, limit):
+        """Up to `limit` oldest frames, without removing them: (end sequence, payloads)"""
+        with self._lock:
+            end = min(self.tail, self.head + limit)
+            payloads = []
+            for sequence in range(self.head, end):
+                payload = self._read_slot(sequence)
+                if payload is not None:
+                    payloads.append(payload)
+            return end, payloads
+
+    def commit(self, end):
+        """Frames before sequence `end` have been delivered"""
+        with self._lock:
+            if end > self.head:
+                self.head = min(end, self.tail)
+                self._write_header()
+
+    def flush(self):
+        """Force the mapped pages to disk"""
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+def backoff_delays(initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX):
+    """Exponential retry delays with full jitter: 0.5s, 1s, 2s, ... capped at `maximum`"""
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * 2, maximum)
+
+
+class SpoolSender:
+    """
+    Drop-in replacement for IoT_object.BatchSender that never blocks the caller
+    send() appends to the spool; a thread posts batches of up to max_frames,
+    waiting at most max_delay for a batch to fill, and backs off while the
+    server is unreachable. on_send(url, started, ok, reason, frames) is called
+    after every post (used for the device metrics). Frames the server keeps
+    refusing are dropped one by one and counted in `quarantined`
+    """
+
+    def __init__(self, url, spool=None, max_frames=200, max_delay=0.5, binary=False,
+                 timeout=REQUEST_TIMEOUT, on_send=None):
+        self.url = url
+        self.spool = spool if spool is not None else RingSpool()
+        self.max_frames = max_frames
+        self.max_delay = max_delay
+        self.binary = binary
+        self.timeout = timeout
+        self.on_send = on_send
+        self.session = requests.Session()
+        self.quarantined = 0
+        self._attempts = 0  # server errors on the current head batch
+        self._isolate = 0   # frames left to resend one by one after a refused batch
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='spool-sender', daemon=True)
+        self._thread.start()
+
+    def send(self, data):
+        """Queue a frame on disk; returns immediately"""
+        self.spool.append(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        if len(self.spool) >= self.max_frames:
+            self._wake.set()
+        return True
+
+    def backlog(self):
+        return len(self.spool)
+
+    def _post(self, payloads):
+        """Post one batch; returns SENT, REJECTED (4xx), FAILED (other status) or UNREACHABLE"""
+        batch = [json.loads(payload) for payload in payloads]
+        started = time.perf_counter()
+        try:
+            if self.binary:
+                response = self.session.post(self.url, data=frame_codec.encode_frames(batch),
+                                             headers=frame_codec.frame_headers(batch[0]),
+                                             timeout=self.timeout)
+            else:
+                response = self.session.post(self.url, json=batch, timeout=self.timeout)
+        except requests.RequestException as e:
+            result, reason = UNREACHABLE, type(e).__name__
+        else:
+            reason = f"http_{response.status_code}"
+            if response.status_code == 200:
+                result = SENT
+            elif 400 <= response.status_code < 500:
+                result = REJECTED
+            else:
+                result = FAILED
+        if self.on_send:
+            self.on_send(self.url, started, result == SENT, reason, len(batch))
+        return result
+
+    def _drain(self):
+        """Send full batches until the spool is empty; False to retry after a backoff"""
+        while len(self.spool):
+            single = self._isolate > 0
+            end, payloads = self.spool.peek(1 if single else self.max_frames)
+            if payloads:
+                result = self._post(payloads)
+                if result == UNREACHABLE:
+                    return False
+                if result == FAILED:
+                    self._attempts += 1
+                    if self._attempts < MAX_ATTEMPTS:
+                        return False
+                self._attempts = 0
+                if result != SENT:
+                    if len(payloads) > 1:
+                        # Find the frames the server refuses instead of dropping the whole batch
+                        print(f"Server refused a batch of {len(payloads)} frames ({result}), "
+                              f"resending them one by one")
+                        self._isolate = end - self.spool.head
+                        continue
+                    print(f"Dropping a frame the server refused ({result})")
+                    self.quarantined += 1
+            if single:
+                self._isolate -= 1
+            self.spool.commit(end)
+        return True
+
+    def _run(self):
+        delays = None
+        while not self._stop.is_set():
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            if self._drain():
+                delays = None
+                continue
+            # Server unreachable: wait longer after each failure, unless asked to stop
+            delays = delays or backoff_delays()
+            self._stop.wait(next(delays))
+        self._drain()
+
+    def flush(self):
+        """Ask the sender thread to post what is buffered now"""
+        self._wake.set()
+        return True
+
+    def close(self, timeout=REQUEST_TIMEOUT):
+        """Stop the sender after a last delivery attempt; unsent frames stay on disk"""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.session.close()
+            self.spool.close()
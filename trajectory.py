@@ -0,0 +1,254 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import requests
+
+import frame_codec
+from samples import SENSORS, parse_timestamp
+from IoT_object import (
+    object_info, EXERCISE, WEIGHT, REPS_PER_SET, TOTAL_SETS, REP_DURATION, SERVER_URL,
+    LEFT_SHOULDER_POS, RIGHT_SHOULDER_POS, BatchSender,
+)
+
+# Vectorized workout generator and accelerated replay
+#
+# generate_session() builds a whole workout (frames x 4 sensors x xyz) as NumPy
+# arrays in one call, following the same movement model as
+# IoT_object.calculate_positions, with a seeded generator for reproducibility.
+# replay() streams a generated or recorded (NDJSON) session to the server at
+# N x real time.
+#
+#   python trajectory.py generate --seed 1 --output session.ndjson
+#   python trajectory.py replay --input session.ndjson --speed 10
+#   python trajectory.py replay --seed 1 --speed 50 --binary
+
+VARIATION = 0.03        # m, random jitter on dumbbell x/z
+VERTICAL_TRAVEL = 0.4   # m, dumbbell travel from shoulder height
+SENSOR_AXES = 12        # 4 sensors x (x, y, z)
+
+# numpy view of frame_codec.FRAME, to pack a whole session in one call
+FRAME_DTYPE = np.dtype([
+    ('version', '<u1'), ('timestamp', '<f8'), ('current_set', '<u2'), ('current_rep', '<u2'),
+    ('total_reps', '<u4'), ('coords', '<f4', (SENSOR_AXES,)), ('temp', '<i2'), ('battery', '<u1'),
+])
+assert FRAME_DTYPE.itemsize == frame_codec.FRAME_SIZE
+
+
+def height_profile(frames_per_rep):
+    """Height factor (0 to 1) over one repetition: half going up, half going down"""
+    half = frames_per_rep // 2
+    progress = np.linspace(0.0, 1.0, half)
+    up = np.sin(progress * np.pi / 2)
+    return np.concatenate((up, 1 - up))
+
+
+def generate_positions(height, rng, variation=VARIATION):
+    """
+    Positions for every frame at once, shape (frames, 4, 3)
+    sensor order: left_dumbbell, right_dumbbell, left_elbow, right_elbow
+    """
+    count = len(height)
+    positions = np.empty((count, 4, 3))
+    noise = rng.uniform(-variation, variation, size=(count, 2, 2))  # (dumbbell, x/z)
+    for index, shoulder in enumerate((LEFT_SHOULDER_POS, RIGHT_SHOULDER_POS)):
+        positions[:, index, 0] = shoulder[0] + noise[:, index, 0]
+        positions[:, index, 1] = shoulder[1] + VERTICAL_TRAVEL * height
+        positions[:, index, 2] = shoulder[2] + noise[:, index, 1]
+    # Elbows sit slightly below and behind the dumbbells and move less
+    positions[:, 2, 0] = positions[:, 0, 0] - 0.1
+    positions[:, 3, 0] = positions[:, 1, 0] + 0.1
+    positions[:, 2:, 1] = positions[:, :2, 1] - 0.25 - (0.1 * height)[:, None]
+    positions[:, 2:, 2] = positions[:, :2, 2] - 0.1
+    return np.round(positions, 3)
+
+
+class Session:
+    """A generated workout held as parallel arrays (one entry per frame)"""
+
+    def __init__(self, timestamps, current_set, current_rep, total_reps, positions,
+                 temp, battery, object_id, exercise=EXERCISE, weight=WEIGHT):
+        self.timestamps = timestamps
+        self.current_set = current_set
+        self.current_rep = current_rep
+        self.total_reps = total_reps
+        self.positions = positions
+        self.temp = temp
+        self.battery = battery
+        self.object_id = object_id
+        self.exercise = exercise
+        self.weight = weight
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def frames(self):
+        """JSON-style frame dicts, in the shape sent by IoT_object"""
+        columns = zip(self.timestamps.tolist(), self.current_set.tolist(),
+                      self.current_rep.tolist(), self.total_reps.tolist(),
+                      self.positions.tolist(), self.temp.tolist(), self.battery.tolist())
+        for timestamp, current_set, current_rep, total_reps, positions, temp, battery in columns:
+            yield {
+                'object_id': self.object_id,
+                'timestamp': timestamp,
+                'exercise': self.exercise,
+                'weight': self.weight,
+                'current_set': current_set,
+                'current_rep': current_rep,
+                'total_reps': total_reps,
+                'sensors': {
+                    sensor: dict(zip('xyz', position))
+                    for sensor, position in zip(SENSORS, positions)
+                },
+                'temp': temp,
+                'battery': battery,
+            }
+
+    def to_binary(self):
+        """Pack every frame in frame_codec layout with a single tobytes()"""
+        packed = np.empty(len(self), dtype=FRAME_DTYPE)
+        packed['version'] = frame_codec.VERSION
+        packed['timestamp'] = self.timestamps
+        packed['current_set'] = self.current_set
+        packed['current_rep'] = self.current_rep
+        packed['total_reps'] = self.total_reps
+        packed['coords'] = self.positions.reshape(len(self), SENSOR_AXES)
+        packed['temp'] = np.round(self.temp * 10)
+        packed['battery'] = self.battery
+        return packed.tobytes()
+
+
+def generate_session(total_sets=TOTAL_SETS, reps_per_set=REPS_PER_SET, frames_per_rep=20,
+                     rep_duration=REP_DURATION, rest=30.0, start=None, seed=None,
+                     object_id=None):
+    """Generate a full workout in one call; `seed` makes it reproducible"""
+    rng = np.random.default_rng(seed)
+    reps = total_sets * reps_per_set
+    profile = height_profile(frames_per_rep)
+    per_rep = len(profile)
+    count = reps * per_rep
+
+    rep_index = np.repeat(np.arange(reps), per_rep)
+    set_index = rep_index // reps_per_set
+    frame_in_rep = np.tile(np.arange(per_rep), reps)
+    interval = rep_duration / per_rep
+    start = time.time() if start is None else start
+    timestamps = start + (rep_index * per_rep + frame_in_rep) * interval + set_index * rest
+
+    return Session(
+        timestamps=timestamps,
+        current_set=set_index + 1,
+        current_rep=rep_index % reps_per_set + 1,
+        total_reps=rep_index,
+        positions=generate_positions(np.tile(profile, reps), rng),
+        temp=np.round(rng.uniform(20, 30, count), 1),
+        battery=rng.integers(60, 101, count),
+        object_id=object_id or object_info['id'],
+    )
+
+
+def load_frames(path):
+    """Recorded session: one JSON frame per line"""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def replay(frames, sender, speed=1.0, timestamps=None):
+    """
+    Stream frames to `sender` paced by their timestamps, `speed` times faster
+    than real time; speed <= 0 sends as fast as the sender accepts them
+    returns (frames sent, elapsed seconds)
+    """
+    started = time.monotonic()
+    first = None
+    sent = 0
+    for index, frame in enumerate(frames):
+        if speed > 0:
+            ts = timestamps[index] if timestamps is not None else parse_timestamp(frame.get('timestamp'))
+            if first is None:
+                first = ts
+            delay = (ts - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        sender.send(frame)
+        sent += 1
+    return sent, time.monotonic() - started
+
+
+def replay_binary(session, url, speed=1.0, batch_frames=200):
+    """Replay a generated session as pre-packed binary batches"""
+    payload = session.to_binary()
+    headers = frame_codec.frame_headers({'object_id': session.object_id,
+                                         'exercise': session.exercise, 'weight': session.weight})
+    timestamps = session.timestamps
+    started = time.monotonic()
+    with requests.Session() as http:
+        for start in range(0, len(session), batch_frames):
+            end = min(start + batch_frames, len(session))
+            if speed > 0:
+                delay = (timestamps[end - 1] - timestamps[0]) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            body = payload[start * frame_codec.FRAME_SIZE:end * frame_codec.FRAME_SIZE]
+            http.post(url, data=body, headers=headers).raise_for_status()
+    return len(session), time.monotonic() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or replay workout sessions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('generate', 'replay'):
+        command = commands.add_parser(name)
+        command.add_argument('--seed', type=int)
+        command.add_argument('--sets', type=int, default=TOTAL_SETS)
+        command.add_argument('--reps', type=int, default=REPS_PER_SET)
+        command.add_argument('--frames-per-rep', type=int, default=20)
+        command.add_argument('--rest', type=float, default=30.0)
+        command.add_argument('--object-id', default=object_info['id'])
+    commands.choices['generate'].add_argument('--output', required=True,
+                                              help="NDJSON file to write")
+    replay_parser = commands.choices['replay']
+    replay_parser.add_argument('--input', help="recorded NDJSON session (generated if omitted)")
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help="replay speed multiplier (0 = as fast as possible)")
+    replay_parser.add_argument('--server', default=SERVER_URL)
+    replay_parser.add_argument('--binary', action='store_true', help="send packed binary frames")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'generate' or not args.input:
+        session = generate_session(args.sets, args.reps, args.frames_per_rep, rest=args.rest,
+                                   seed=args.seed, object_id=args.object_id)
+
+    if args.command == 'generate':
+        with open(args.output, 'w') as file:
+            for frame in session.frames():
+                file.write(json.dumps(frame) + '\n')
+        print(f"Wrote {len(session)} frames to {args.output}")
+        return
+
+    url = f"{args.server}/handle_use_batch"
+    if args.input:
+        sender = BatchSender(url, max_frames=200, binary=args.binary)
+        try:
+            sent, elapsed = replay(load_frames(args.input), sender, args.speed)
+        finally:
+            sender.close()
+    elif args.binary:
+        sent, elapsed = replay_binary(session, url, args.speed)
+    else:
+        sender = BatchSender(url, max_frames=200)
+        try:
+            sent, elapsed = replay(session.frames(), sender, args.speed, session.timestamps)
+        finally:
+            sender.close()
+    print(f"Replayed {sent} frames in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f} frames/s)")
+
+
+if __name__ == '__main__':
+    main()